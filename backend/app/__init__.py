@@ -1,13 +1,53 @@
-from flask import Flask
+import os
+from flask import Flask, current_app, send_from_directory
 from flask_cors import CORS
-from flask_restx import Api
 from config import config
-from app.api.routes import api
-from app.core.database import init_db
 
-def create_app(config_name='default'):
-    """Application factory function"""
+# Error response bodies, built once at import
+NOT_FOUND_RESPONSE = {'error': 'Not found'}
+INTERNAL_ERROR_RESPONSE = {'error': 'Internal server error'}
+TOO_LARGE_RESPONSE = {'error': 'File too large'}
+
+def not_found(error):
+    return NOT_FOUND_RESPONSE, 404
+
+def internal_error(error):
+    return INTERNAL_ERROR_RESPONSE, 500
+
+def too_large(error):
+    return TOO_LARGE_RESPONSE, 413
+
+ERROR_HANDLERS = ((404, not_found), (500, internal_error), (413, too_large))
+
+# Precomputed Swagger schema, relative to the app static folder
+SCHEMA_FILENAME = 'swagger.json'
+SCHEMA_MAX_AGE = 86400
+
+def static_schema():
+    """Serve the precomputed Swagger schema"""
+    return send_from_directory(current_app.static_folder, SCHEMA_FILENAME, max_age=SCHEMA_MAX_AGE)
+
+def create_app(config_name='default', init_database=True):
+    """
+    Application factory function
+    
+    init_database=False skips creating the SQLite schema, for tools that only
+    need the app's routes (e.g. python -m app.dump_schema at image build time)
+    """
+    # Imported here so importing the package doesn't pull in Flask-RESTX,
+    # the LLM client stack and the database engine
+    from flask_restx import Api
+    from app.utils.log import configure_logging
+    from app.utils.helpers import OrjsonProvider, orjson_representation
+    
+    # Set up queued logging before the imports below log anything
+    configure_logging()
+    
+    from app.api.routes import api
+    from app.core.database import init_db, close_db
+    
     app = Flask(__name__)
+    app.json = OrjsonProvider(app)
     
     # Load configuration
     app.config.from_object(config[config_name])
@@ -16,7 +56,13 @@ def create_app(config_name='default'):
     CORS(app, resources={r"/api/*": {"origins": "*"}})
     
     # Initialize database
-    init_db()
+    if init_database:
+        init_db()
+    
+    # Release the request-scoped session when each request ends
+    @app.teardown_appcontext
+    def remove_session(exception=None):
+        close_db()
     
     # Initialize API with Flask-restx
     api_instance = Api(
@@ -24,23 +70,27 @@ def create_app(config_name='default'):
         title='PromptViz API',
         version='1.0',
         description='AI-powered system prompt visualization API',
-        doc='/'
+        doc='/' if app.config['API_DOCS_ENABLED'] else False
     )
     
+    # Serialize Resource return values with orjson instead of the stdlib encoder
+    api_instance.representations['application/json'] = orjson_representation
+    
     # Add the API namespace
     api_instance.add_namespace(api)
     
-    # Register error handlers
-    @app.errorhandler(404)
-    def not_found(error):
-        return {'error': 'Not found'}, 404
+    app.extensions['api'] = api_instance
     
-    @app.errorhandler(500)
-    def internal_error(error):
-        return {'error': 'Internal server error'}, 500
+    # Serve the schema dumped at build time (python -m app.dump_schema) when present,
+    # otherwise build it once at startup; Flask-RESTX memoizes it
+    if os.path.exists(os.path.join(app.static_folder, SCHEMA_FILENAME)):
+        app.view_functions['specs'] = static_schema
+    else:
+        with app.test_request_context():
+            api_instance.__schema__
     
-    @app.errorhandler(413)
-    def too_large(error):
-        return {'error': 'File too large'}, 413
+    # Register error handlers
+    for code, handler in ERROR_HANDLERS:
+        app.register_error_handler(code, handler)
     
     return app 
\ No newline at end of file
@@ -1,24 +1,45 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 from typing import Optional, List, Dict, Any
+from dataclasses import dataclass
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, Text, Float, Boolean, DateTime, Index, ForeignKey
+from operator import attrgetter
+from sqlalchemy import Column, Integer, String, Text, Float, Boolean, DateTime, Index, ForeignKey, JSON, desc
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.core.database import Base
 
+# Request models are read-only once parsed; unknown client keys are dropped
+REQUEST_MODEL_CONFIG = ConfigDict(extra='ignore', frozen=True)
+
 class GenerateDiagramRequest(BaseModel):
     """Request model for diagram generation"""
+    model_config = REQUEST_MODEL_CONFIG
+    
     prompt: str = Field(..., description="Text prompt to visualize", min_length=1)
     model: Optional[str] = Field(default="gpt-4", description="AI model to use")
     diagram_type: Optional[str] = Field(default="flowchart", description="Type of diagram to generate")
 
 class FileUploadRequest(BaseModel):
     """Request model for file upload"""
+    model_config = REQUEST_MODEL_CONFIG
+    
     file_content: str = Field(..., description="Content of uploaded file")
     filename: str = Field(..., description="Name of uploaded file")
     model: Optional[str] = Field(default="gpt-4", description="AI model to use")
     diagram_type: Optional[str] = Field(default="flowchart", description="Type of diagram to generate")
 
+class ValidateKeyRequest(BaseModel):
+    """Request model for API key validation"""
+    model_config = REQUEST_MODEL_CONFIG
+    
+    model: Optional[str] = Field(None, description="Model to test the key with")
+    api_key: Optional[str] = Field(None, description="API key to validate")
+
+# Response models describe payloads built from trusted server-side data
+# (LLM results, DB rows, the model registry). Handlers return plain dicts;
+# if a response model is ever hydrated, use Model.model_construct(...) so
+# the data isn't validated a second time.
 class GenerateDiagramResponse(BaseModel):
     """Response model for diagram generation"""
     mermaid_code: str = Field(..., description="Generated Mermaid diagram code")
@@ -26,31 +47,38 @@ class GenerateDiagramResponse(BaseModel):
     ai_model_used: str = Field(..., description="AI model that was used")  # Renamed to avoid conflict
     processing_time: Optional[float] = Field(None, description="Time taken to process in seconds")
     error_message: Optional[str] = Field(None, description="Error message if generation failed")
+    cached: bool = Field(False, description="Whether the result was served from the cache")
     
-    class Config:
-        protected_namespaces = ()  # Disable protected namespace warnings
+    model_config = ConfigDict(protected_namespaces=())  # Disable protected namespace warnings
 
 class HealthResponse(BaseModel):
     """Health check response"""
     status: str = Field(..., description="Service status")
     timestamp: datetime = Field(..., description="Current timestamp")
     version: str = Field(..., description="API version")
+    llm_available: bool = Field(False, description="Whether an LLM provider API key is configured")
 
-class ModelInfo(BaseModel):
+# Plain output containers, serialized directly by orjson. __slots__ is spelled
+# out because dataclass(slots=True) needs Python 3.10
+@dataclass(frozen=True)
+class ModelInfo:
     """AI model information"""
-    name: str = Field(..., description="Model name")
-    provider: str = Field(..., description="Model provider")
-    available: bool = Field(..., description="Whether model is available")
+    __slots__ = ('name', 'provider', 'available')
+    name: str  # Model name
+    provider: str  # Model provider
+    available: bool  # Whether model is available
 
 class ModelsResponse(BaseModel):
     """Available models response"""
     models: List[ModelInfo] = Field(..., description="List of available models")
 
-class SystemPromptInfo(BaseModel):
+@dataclass(frozen=True)
+class SystemPromptInfo:
     """System prompt information"""
-    name: str = Field(..., description="Prompt name")
-    description: str = Field(..., description="Prompt description")
-    type: str = Field(..., description="Prompt type")
+    __slots__ = ('name', 'description', 'type')
+    name: str  # Prompt name
+    description: str  # Prompt description
+    type: str  # Prompt type
 
 class SystemPromptsResponse(BaseModel):
     """Available system prompts response"""
@@ -60,6 +88,8 @@ class SystemPromptsResponse(BaseModel):
 # Pydantic models for prompt generation
 class DiagramNode(BaseModel):
     """Node structure for diagram"""
+    model_config = REQUEST_MODEL_CONFIG
+    
     id: str = Field(..., description="Node ID")
     type: str = Field(..., description="Node type (rectangle, diamond, rounded, etc.)")
     label: str = Field(..., description="Node label text")
@@ -67,6 +97,8 @@ class DiagramNode(BaseModel):
 
 class DiagramEdge(BaseModel):
     """Edge structure for diagram"""
+    model_config = REQUEST_MODEL_CONFIG
+    
     id: str = Field(..., description="Edge ID")
     source: str = Field(..., description="Source node ID")
     target: str = Field(..., description="Target node ID")
@@ -74,11 +106,15 @@ class DiagramEdge(BaseModel):
 
 class DiagramStructure(BaseModel):
     """Complete diagram structure"""
+    model_config = REQUEST_MODEL_CONFIG
+    
     nodes: List[DiagramNode] = Field(..., description="List of diagram nodes")
     edges: List[DiagramEdge] = Field(..., description="List of diagram edges")
 
 class GeneratePromptRequest(BaseModel):
     """Request model for prompt generation from diagram"""
+    model_config = REQUEST_MODEL_CONFIG
+    
     diagram_structure: DiagramStructure = Field(..., description="Diagram structure with nodes and edges")
     original_prompt: Optional[str] = Field(None, description="Original prompt used to generate the diagram")
     prompt_format: str = Field(default="xml", description="Output format: 'xml' or 'markdown'")
@@ -94,12 +130,16 @@ class GeneratePromptResponse(BaseModel):
     ai_model_used: str = Field(..., description="AI model that was used")
     processing_time: Optional[float] = Field(None, description="Time taken to process in seconds")
     error_message: Optional[str] = Field(None, description="Error message if generation failed")
+    cached: bool = Field(False, description="Whether the result was served from the cache")
 
-    class Config:
-        protected_namespaces = ()
+    model_config = ConfigDict(protected_namespaces=())
 
 
 # SQLAlchemy Database Models
+#
+# Relationships default to selectin loading. Read endpoints that only
+# serialize columns query with .options(raiseload('*')) so an accidental
+# relationship access raises instead of silently adding per-row queries.
 class Diagram(Base):
     """SQLAlchemy model for storing generated diagrams"""
     __tablename__ = 'diagrams'
@@ -112,30 +152,44 @@ class Diagram(Base):
     processing_time = Column(Float, nullable=True)
     success = Column(Boolean, nullable=False, default=True)
     error_message = Column(Text, nullable=True)
+    # Fingerprint of the system prompt the diagram was generated with (None for older rows)
+    system_prompt_version = Column(String(64), nullable=True)
     created_at = Column(DateTime, server_default=func.now(), nullable=False)
     updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now(), nullable=False)
     
+    # Relationship to generated prompts (loaded in one IN() query per batch of diagrams)
+    generated_prompts = relationship("GeneratedPrompt", back_populates="diagram", lazy="selectin")
+    
     # Indexes for better query performance
     __table_args__ = (
         Index('idx_diagrams_created_at', 'created_at'),
         Index('idx_diagrams_model_used', 'model_used'),
         Index('idx_diagrams_diagram_type', 'diagram_type'),
+        Index('idx_diagrams_type_model', 'diagram_type', 'model_used'),
+        # Exact-input lookup used to reuse a stored diagram instead of regenerating it
+        Index('idx_diagrams_lookup', 'original_prompt', 'model_used', 'diagram_type'),
+    )
+    
+    # Columns exposed by to_dict, in output order
+    _FIELDS = (
+        'id', 'mermaid_code', 'original_prompt', 'model_used', 'diagram_type',
+        'processing_time', 'success', 'error_message', 'created_at', 'updated_at',
     )
+    _get_fields = attrgetter(*_FIELDS)
     
     def to_dict(self):
-        """Convert model instance to dictionary"""
-        return {
-            'id': self.id,
-            'mermaid_code': self.mermaid_code,
-            'original_prompt': self.original_prompt,
-            'model_used': self.model_used,
-            'diagram_type': self.diagram_type,
-            'processing_time': self.processing_time,
-            'success': self.success,
-            'error_message': self.error_message,
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
-        }
+        """Convert model instance to dictionary (datetimes are left for orjson to encode)"""
+        return dict(zip(self._FIELDS, self._get_fields(self)))
+    
+    @classmethod
+    def list_columns(cls):
+        """Columns to select for read-only listings, which skip ORM instance loading"""
+        return [getattr(cls, name) for name in cls._FIELDS]
+    
+    @classmethod
+    def row_to_dict(cls, row):
+        """Convert a row selected with list_columns() into the same dict as to_dict"""
+        return dict(zip(cls._FIELDS, row))
 
 
 class GeneratedPrompt(Base):
@@ -144,7 +198,7 @@ class GeneratedPrompt(Base):
     
     id = Column(Integer, primary_key=True, autoincrement=True)
     diagram_id = Column(Integer, ForeignKey('diagrams.id'), nullable=True)
-    diagram_structure = Column(Text, nullable=False)  # JSON string of nodes/edges
+    diagram_structure = Column(JSON().with_variant(JSONB(), 'postgresql'), nullable=False)  # nodes/edges
     original_prompt = Column(Text, nullable=True)
     generated_prompt = Column(Text, nullable=False)
     prompt_format = Column(String(20), nullable=False)  # 'xml' or 'markdown'
@@ -156,28 +210,33 @@ class GeneratedPrompt(Base):
     updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now(), nullable=False)
     
     # Relationship to Diagram
-    diagram = relationship("Diagram", backref="generated_prompts")
+    diagram = relationship("Diagram", back_populates="generated_prompts", lazy="selectin")
     
     # Indexes for better query performance
     __table_args__ = (
         Index('idx_generated_prompts_created_at', 'created_at'),
-        Index('idx_generated_prompts_diagram_id', 'diagram_id'),
+        Index('idx_generated_prompts_diagram_created', 'diagram_id', desc('created_at')),
         Index('idx_generated_prompts_format', 'prompt_format'),
     )
     
+    # Columns exposed by to_dict, in output order
+    _FIELDS = (
+        'id', 'diagram_id', 'diagram_structure', 'original_prompt', 'generated_prompt',
+        'prompt_format', 'model_used', 'processing_time', 'success', 'error_message',
+        'created_at', 'updated_at',
+    )
+    _get_fields = attrgetter(*_FIELDS)
+    
     def to_dict(self):
-        """Convert model instance to dictionary"""
-        return {
-            'id': self.id,
-            'diagram_id': self.diagram_id,
-            'diagram_structure': self.diagram_structure,
-            'original_prompt': self.original_prompt,
-            'generated_prompt': self.generated_prompt,
-            'prompt_format': self.prompt_format,
-            'model_used': self.model_used,
-            'processing_time': self.processing_time,
-            'success': self.success,
-            'error_message': self.error_message,
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
-        } 
\ No newline at end of file
+        """Convert model instance to dictionary (datetimes are left for orjson to encode)"""
+        return dict(zip(self._FIELDS, self._get_fields(self)))
+    
+    @classmethod
+    def list_columns(cls):
+        """Columns to select for read-only listings, which skip ORM instance loading"""
+        return [getattr(cls, name) for name in cls._FIELDS]
+    
+    @classmethod
+    def row_to_dict(cls, row):
+        """Convert a row selected with list_columns() into the same dict as to_dict"""
+        return dict(zip(cls._FIELDS, row)) 
\ No newline at end of file
@@ -1,18 +1,33 @@
+import logging
 import os
-import json
-from flask import request, jsonify
+import time
+from datetime import datetime, timedelta
+from functools import lru_cache
+import orjson
+from flask import Response, request, stream_with_context
 from flask_restx import Namespace, Resource, fields
-from werkzeug.utils import secure_filename
+from sqlalchemy import text
+from sqlalchemy.orm import raiseload
 from app.core.llm_client import LiteLLMClient
-from app.utils.helpers import allowed_file, validate_prompt_text
+from app.core.aio import run_until_disconnect, iterate_sync, ClientDisconnected
+from app.core.batcher import DiagramBatcher
+from app.core.writer import db_writer
+from app.core.llm_cache import create_llm_cache, make_cache_key, normalize_prompt
+from app.utils.helpers import (
+    allowed_file, validate_prompt_text, json_response, json_bytes_response, client_disconnected,
+    body_etag, conditional_json_response
+)
 from app.api.models import (
     GenerateDiagramRequest, GenerateDiagramResponse, HealthResponse,
     ModelsResponse, SystemPromptsResponse, Diagram, GeneratedPrompt,
-    GeneratePromptRequest
+    GeneratePromptRequest, ValidateKeyRequest, ModelInfo, SystemPromptInfo
 )
-from app.core.database import get_db
+from app.core import database
+from app.core.database import SessionLocal
 from config import Config
 
+log = logging.getLogger(__name__)
+
 # Initialize API namespace
 api = Namespace('api', description='PromptViz API endpoints')
 
@@ -20,9 +35,15 @@ api = Namespace('api', description='PromptViz API endpoints')
 try:
     llm_client = LiteLLMClient()
 except Exception as e:
-    print(f"Warning: LiteLLM client initialization failed: {e}")
+    log.warning("LiteLLM client initialization failed: %s", e)
     llm_client = None
 
+# Initialize LLM response cache (None when disabled)
+llm_cache = create_llm_cache()
+
+# Coalesce concurrent diagram requests into batches when enabled
+diagram_batcher = DiagramBatcher(llm_client) if llm_client and Config.LLM_BATCH_ENABLED else None
+
 # API Models for Swagger documentation
 generate_diagram_model = api.model('GenerateDiagram', {
     'prompt': fields.String(required=True, description='Text prompt to visualize'),
@@ -35,31 +56,13 @@ generate_diagram_response = api.model('GenerateDiagramResponse', {
     'success': fields.Boolean(description='Whether the generation was successful'),
     'ai_model_used': fields.String(description='AI model that was used'),
     'processing_time': fields.Float(description='Time taken to process in seconds'),
-    'error_message': fields.String(description='Error message if generation failed')
+    'error_message': fields.String(description='Error message if generation failed'),
+    'cached': fields.Boolean(description='Whether the result was served from the cache')
 })
 
 # API Models for prompt generation
-diagram_node_model = api.model('DiagramNode', {
-    'id': fields.String(required=True, description='Node ID'),
-    'type': fields.String(required=True, description='Node type'),
-    'label': fields.String(required=True, description='Node label'),
-    'position': fields.Raw(description='Node position {x, y}')
-})
-
-diagram_edge_model = api.model('DiagramEdge', {
-    'id': fields.String(required=True, description='Edge ID'),
-    'source': fields.String(required=True, description='Source node ID'),
-    'target': fields.String(required=True, description='Target node ID'),
-    'label': fields.String(description='Edge label')
-})
-
-diagram_structure_model = api.model('DiagramStructure', {
-    'nodes': fields.List(fields.Nested(diagram_node_model), required=True),
-    'edges': fields.List(fields.Nested(diagram_edge_model), required=True)
-})
-
 generate_prompt_model = api.model('GeneratePrompt', {
-    'diagram_structure': fields.Nested(diagram_structure_model, required=True),
+    'diagram_structure': fields.Raw(required=True, description='Diagram structure {nodes: [{id, type, label, position}], edges: [{id, source, target, label}]}'),
     'original_prompt': fields.String(description='Original prompt that generated the diagram'),
     'prompt_format': fields.String(description='Output format: xml or markdown', default='xml'),
     'model': fields.String(description='AI model to use'),
@@ -73,9 +76,14 @@ generate_prompt_response = api.model('GeneratePromptResponse', {
     'success': fields.Boolean(description='Whether generation was successful'),
     'ai_model_used': fields.String(description='AI model that was used'),
     'processing_time': fields.Float(description='Time taken to process in seconds'),
-    'error_message': fields.String(description='Error message if generation failed')
+    'error_message': fields.String(description='Error message if generation failed'),
+    'cached': fields.Boolean(description='Whether the result was served from the cache')
 })
 
+# Health body is rebuilt at most once per HEALTH_CACHE_SECONDS, since probes hit it constantly
+HEALTH_CACHE_SECONDS = 1.0
+_HEALTH_CACHE = {'ts': float('-inf'), 'body': b''}
+
 @api.route('/health')
 class HealthCheck(Resource):
     """Health check endpoint"""
@@ -84,84 +92,291 @@ class HealthCheck(Resource):
     @api.response(200, 'Success', generate_diagram_response)
     def get(self):
         """Health check endpoint"""
-        from datetime import datetime
-        return {
-            'status': 'ok',
-            'timestamp': datetime.utcnow().isoformat(),
-            'version': '1.0.0'
-        }
+        now = time.monotonic()
+        if now - _HEALTH_CACHE['ts'] > HEALTH_CACHE_SECONDS:
+            health = {
+                'status': 'ok',
+                'timestamp': datetime.utcnow().isoformat(),
+                'version': '1.0.0',
+                'llm_available': llm_client is not None
+            }
+            if llm_cache:
+                health['llm_cache'] = llm_cache.get_stats()
+            _HEALTH_CACHE['body'] = orjson.dumps(health)
+            _HEALTH_CACHE['ts'] = now
+        return json_bytes_response(_HEALTH_CACHE['body'])
+
+def run_llm_call(coro):
+    """Run an LLM coroutine, cancelling it if the client disconnects while it is in flight"""
+    environ = request.environ
+    return run_until_disconnect(
+        coro,
+        lambda: client_disconnected(environ),
+        Config.LLM_DISCONNECT_POLL_INTERVAL
+    )
+
+# Response for a request whose client went away before the LLM call finished
+CLIENT_DISCONNECTED_RESPONSE = {'error': 'Client disconnected'}, 499
+
+# Response for a ?cursor= that isn't a row id from a previous next_cursor
+INVALID_CURSOR_RESPONSE = {'error': 'Invalid cursor'}, 400
+
+def find_stored_diagram(prompt, model, diagram_type, system_prompt_version, max_age=None):
+    """
+    Look up the latest stored diagram with these inputs
+    
+    Args:
+        system_prompt_version: Only rows generated with this system prompt fingerprint
+        max_age: Ignore rows older than this many seconds (None = any age)
+        
+    Returns:
+        (response_data, age_seconds), or None when there is no such diagram
+    """
+    now = datetime.utcnow()
+    db = SessionLocal()
+    try:
+        query = db.query(Diagram.mermaid_code, Diagram.model_used, Diagram.created_at).filter(
+            Diagram.original_prompt == prompt,
+            Diagram.model_used == model,
+            Diagram.diagram_type == diagram_type,
+            Diagram.system_prompt_version == system_prompt_version,
+            Diagram.success.is_(True)
+        )
+        if max_age:
+            query = query.filter(Diagram.created_at >= now - timedelta(seconds=max_age))
+        row = query.order_by(Diagram.created_at.desc()).first()
+    except Exception:
+        log.exception("Error looking up stored diagram")
+        return None
+    
+    if row is None:
+        return None
+    response_data = {
+        'mermaid_code': row.mermaid_code,
+        'success': True,
+        'ai_model_used': row.model_used,
+        'processing_time': 0,
+        'error_message': None,
+        'cached': False
+    }
+    return response_data, max((now - row.created_at).total_seconds(), 0)
+
+def find_cached_diagram(prompt, model, diagram_type):
+    """
+    Look up a reusable result for a diagram request
+    
+    Returns:
+        (cache_key, response_data) where response_data is None on a miss and
+        cache_key is None when caching is disabled
+    """
+    if not llm_cache:
+        return None, None
+    
+    # Keyed on the whitespace-normalized prompt so reformatted copies of a prompt also hit
+    cache_key = make_cache_key(
+        'diagram',
+        model=model or llm_client.default_model,
+        type=diagram_type,
+        prompt=normalize_prompt(prompt),
+        system_prompt=llm_client.system_prompt_version
+    )
+    cached = llm_cache.get(cache_key)
+    if cached is not None:
+        return cache_key, {**cached, 'processing_time': 0, 'cached': True}
+    
+    # Reuse a diagram already stored for the same prompt instead of inserting a duplicate, as
+    # long as it came from the current system prompt and is still within the cache TTL, and
+    # cache it only for what is left of that TTL
+    ttl = Config.LLM_CACHE_TTL
+    stored = find_stored_diagram(prompt, model or llm_client.default_model, diagram_type,
+                                 llm_client.system_prompt_version, max_age=ttl)
+    if stored is not None:
+        existing, age = stored
+        llm_cache.set(cache_key, existing, ttl=max(int(ttl - age), 1) if ttl else None)
+        return cache_key, {**existing, 'cached': True}
+    
+    return cache_key, None
+
+def save_diagram_result(prompt, diagram_type, result, cache_key):
+    """Queue a successful generation for saving, cache it and build the response data"""
+    # Queue diagram for saving; the background writer batches commits
+    db_writer.enqueue(Diagram(
+        mermaid_code=result['mermaid_code'],
+        original_prompt=prompt,
+        model_used=result['model_used'],
+        diagram_type=diagram_type,
+        processing_time=result['processing_time'],
+        success=result['success'],
+        error_message=result['error_message'],
+        system_prompt_version=llm_client.system_prompt_version
+    ))
+    
+    # Update the response to use the new field name
+    response_data = {
+        'mermaid_code': result['mermaid_code'],
+        'success': result['success'],
+        'ai_model_used': result['model_used'],
+        'processing_time': result['processing_time'],
+        'error_message': result['error_message'],
+        'cached': False
+    }
+    if cache_key:
+        llm_cache.set(cache_key, response_data)
+    return response_data
+
+def save_generated_prompt(request_data, diagram_dict, generated_prompt, model_used, processing_time):
+    """
+    Save a generated prompt, waiting for its batched commit to get the id
+    
+    Returns:
+        The new row's id, or None if saving failed or the writer didn't get to it in time
+    """
+    try:
+        row = db_writer.enqueue_and_wait(GeneratedPrompt(
+            diagram_id=request_data.diagram_id,
+            diagram_structure=diagram_dict,
+            original_prompt=request_data.original_prompt,
+            generated_prompt=generated_prompt,
+            prompt_format=request_data.prompt_format,
+            model_used=model_used,
+            processing_time=processing_time,
+            success=True,
+            error_message=None
+        ), timeout=Config.DB_WRITE_WAIT_TIMEOUT)
+        return row.id
+    except Exception:
+        log.exception("Error saving generated prompt to database")
+        return None
+
+def generate_diagram_response_data(prompt, model, diagram_type):
+    """Generate a diagram (or reuse a cached result), save it and build the response"""
+    cache_key, cached = find_cached_diagram(prompt, model, diagram_type)
+    if cached is not None:
+        return json_response(cached)
+    
+    # Generate diagram
+    generator = diagram_batcher.generate if diagram_batcher else llm_client.agenerate_diagram
+    try:
+        result = run_llm_call(generator(
+            user_prompt=prompt,
+            model=model,
+            diagram_type=diagram_type
+        ))
+    except ClientDisconnected:
+        return CLIENT_DISCONNECTED_RESPONSE
+    
+    if not result['success']:
+        return {'error': result['error_message']}, 500
+    
+    return json_response(save_diagram_result(prompt, diagram_type, result, cache_key))
+
+def ndjson_line(event):
+    """Encode one event of a streamed response as a newline-delimited JSON line"""
+    return orjson.dumps(event) + b'\n'
+
+def stream_diagram_events(prompt, model, diagram_type):
+    """
+    Yield NDJSON events for a streamed diagram generation
+    
+    Emits {"type": "chunk", "content": ...} lines while the model output arrives,
+    then a final {"type": "result", ...} line with the same fields as the
+    /generate-diagram response, or {"type": "error", "error": ...} on failure.
+    """
+    cache_key, cached = find_cached_diagram(prompt, model, diagram_type)
+    if cached is not None:
+        yield ndjson_line({'type': 'result', **cached})
+        return
+    
+    result = None
+    for event in iterate_sync(llm_client.astream_diagram(prompt, model, diagram_type)):
+        if event['type'] == 'chunk':
+            yield ndjson_line(event)
+        else:
+            result = event['result']
+    
+    if result is None or not result['success']:
+        yield ndjson_line({'type': 'error', 'error': result['error_message'] if result else 'No result'})
+        return
+    
+    yield ndjson_line({'type': 'result', **save_diagram_result(prompt, diagram_type, result, cache_key)})
+
+def parse_generate_diagram_request():
+    """
+    Parse and validate a diagram generation body
+    
+    Returns:
+        (request_data, None) on success, or (None, error_response)
+    """
+    # Parse and validate the raw body in a single pass
+    raw_data = request.get_data(cache=False)
+    if not raw_data:
+        return None, ({'error': 'No JSON data provided'}, 400)
+    
+    try:
+        request_data = GenerateDiagramRequest.model_validate_json(raw_data)
+    except Exception as e:
+        return None, ({'error': f'Validation error: {str(e)}'}, 400)
+    
+    # Validate prompt text
+    if not validate_prompt_text(request_data.prompt):
+        return None, ({'error': 'Prompt text is too short or invalid'}, 400)
+    
+    # Check if LLM client is available
+    if not llm_client:
+        return None, ({'error': 'LLM service not available'}, 500)
+    
+    return request_data, None
 
 @api.route('/generate-diagram')
 class GenerateDiagram(Resource):
     """Generate Mermaid diagram from text prompt"""
     
-    @api.doc('generate_diagram')
-    @api.expect(generate_diagram_model)
+    @api.doc('generate_diagram', body=generate_diagram_model)
     @api.response(200, 'Success', generate_diagram_response)
     @api.response(400, 'Bad Request')
     @api.response(500, 'Internal Server Error')
     def post(self):
         """Generate Mermaid diagram from text prompt"""
         try:
-            # Parse request data
-            data = request.get_json()
-            if not data:
-                return {'error': 'No JSON data provided'}, 400
-            
-            # Validate request
-            try:
-                request_data = GenerateDiagramRequest(**data)
-            except Exception as e:
-                return {'error': f'Validation error: {str(e)}'}, 400
-            
-            # Validate prompt text
-            if not validate_prompt_text(request_data.prompt):
-                return {'error': 'Prompt text is too short or invalid'}, 400
-            
-            # Check if LLM client is available
-            if not llm_client:
-                return {'error': 'LLM service not available'}, 500
+            request_data, error = parse_generate_diagram_request()
+            if error:
+                return error
             
-            # Generate diagram
-            result = llm_client.generate_diagram(
-                user_prompt=request_data.prompt,
+            return generate_diagram_response_data(
+                prompt=request_data.prompt,
                 model=request_data.model,
-                diagram_type=request_data.diagram_type
+                diagram_type=request_data.diagram_type or 'flowchart'
             )
-            
-            if result['success']:
-                # Save diagram to database
-                try:
-                    db = next(get_db())
-                    diagram = Diagram(
-                        mermaid_code=result['mermaid_code'],
-                        original_prompt=request_data.prompt,
-                        model_used=result['model_used'],
-                        diagram_type=request_data.diagram_type or 'flowchart',
-                        processing_time=result['processing_time'],
-                        success=result['success'],
-                        error_message=result['error_message']
-                    )
-                    db.add(diagram)
-                    db.commit()
-                except Exception as db_error:
-                    # Log error but don't fail the request
-                    print(f"Error saving diagram to database: {db_error}")
-                    db.rollback()
-                finally:
-                    db.close()
                 
-                # Update the response to use the new field name
-                response_data = {
-                    'mermaid_code': result['mermaid_code'],
-                    'success': result['success'],
-                    'ai_model_used': result['model_used'],
-                    'processing_time': result['processing_time'],
-                    'error_message': result['error_message']
-                }
-                return response_data, 200
-            else:
-                return {'error': result['error_message']}, 500
+        except Exception as e:
+            return {'error': f'Internal server error: {str(e)}'}, 500
+
+@api.route('/generate-diagram/stream')
+class GenerateDiagramStream(Resource):
+    """Generate Mermaid diagram from text prompt, streaming model output as it arrives"""
+    
+    @api.doc('generate_diagram_stream', body=generate_diagram_model)
+    @api.response(200, 'Success (application/x-ndjson stream of chunk events, then a result or error event)')
+    @api.response(400, 'Bad Request')
+    @api.response(500, 'Internal Server Error')
+    def post(self):
+        """Generate Mermaid diagram from text prompt as an NDJSON stream"""
+        try:
+            request_data, error = parse_generate_diagram_request()
+            if error:
+                return error
+            
+            events = stream_diagram_events(
+                prompt=request_data.prompt,
+                model=request_data.model,
+                diagram_type=request_data.diagram_type or 'flowchart'
+            )
+            # X-Accel-Buffering lets nginx pass lines through as they are written
+            return Response(
+                stream_with_context(events),
+                mimetype='application/x-ndjson',
+                headers={'X-Accel-Buffering': 'no'}
+            )
                 
         except Exception as e:
             return {'error': f'Internal server error: {str(e)}'}, 500
@@ -189,9 +404,13 @@ class UploadFile(Resource):
             if not allowed_file(file.filename):
                 return {'error': f'File type not allowed. Allowed types: {", ".join(Config.ALLOWED_EXTENSIONS)}'}, 400
             
-            # Read file content
+            # Read file content (bounded, so an oversized upload can't exhaust memory)
+            raw = file.stream.read(Config.MAX_UPLOAD_BYTES + 1)
+            if len(raw) > Config.MAX_UPLOAD_BYTES:
+                return {'error': 'File too large'}, 413
+            
             try:
-                file_content = file.read().decode('utf-8')
+                file_content = str(raw, 'utf-8')
             except UnicodeDecodeError:
                 return {'error': 'File encoding not supported. Please use UTF-8 encoded files.'}, 400
             
@@ -207,46 +426,11 @@ class UploadFile(Resource):
             if not llm_client:
                 return {'error': 'LLM service not available'}, 500
             
-            # Generate diagram
-            result = llm_client.generate_diagram(
-                user_prompt=file_content,
+            return generate_diagram_response_data(
+                prompt=file_content,
                 model=model,
                 diagram_type=diagram_type
             )
-            
-            if result['success']:
-                # Save diagram to database
-                try:
-                    db = next(get_db())
-                    diagram = Diagram(
-                        mermaid_code=result['mermaid_code'],
-                        original_prompt=file_content,
-                        model_used=result['model_used'],
-                        diagram_type=diagram_type,
-                        processing_time=result['processing_time'],
-                        success=result['success'],
-                        error_message=result['error_message']
-                    )
-                    db.add(diagram)
-                    db.commit()
-                except Exception as db_error:
-                    # Log error but don't fail the request
-                    print(f"Error saving diagram to database: {db_error}")
-                    db.rollback()
-                finally:
-                    db.close()
-                
-                # Update the response to use the new field name
-                response_data = {
-                    'mermaid_code': result['mermaid_code'],
-                    'success': result['success'],
-                    'ai_model_used': result['model_used'],
-                    'processing_time': result['processing_time'],
-                    'error_message': result['error_message']
-                }
-                return response_data, 200
-            else:
-                return {'error': result['error_message']}, 500
                 
         except Exception as e:
             return {'error': f'Internal server error: {str(e)}'}, 500
@@ -259,25 +443,32 @@ class Diagrams(Resource):
     @api.response(200, 'Success')
     def get(self):
         """Get list of saved diagrams with optional filtering and pagination"""
+        db = SessionLocal()
         try:
-            db = next(get_db())
-            
             # Get query parameters
             search = request.args.get('search', '').strip()
             model = request.args.get('model', '').strip()
             diagram_type = request.args.get('diagram_type', '').strip()
             limit = int(request.args.get('limit', 50))
             offset = int(request.args.get('offset', 0))
+            cursor = request.args.get('cursor')  # '' for the first page, then the previous next_cursor
             
-            # Build query
-            query = db.query(Diagram)
+            # Build query over plain column tuples; listings don't need ORM instances
+            query = db.query(*Diagram.list_columns())
             
             # Apply filters
             if search:
-                query = query.filter(
-                    Diagram.original_prompt.contains(search) |
-                    Diagram.mermaid_code.contains(search)
-                )
+                # The trigram index needs at least 3 characters to match
+                if database.fts_available and len(search) >= 3:
+                    query = query.filter(
+                        text("diagrams.id IN (SELECT rowid FROM diagrams_fts WHERE diagrams_fts MATCH :search)")
+                        .bindparams(search='"' + search.replace('"', '""') + '"')
+                    )
+                else:
+                    query = query.filter(
+                        Diagram.original_prompt.contains(search) |
+                        Diagram.mermaid_code.contains(search)
+                    )
             
             if model:
                 query = query.filter(Diagram.model_used == model)
@@ -285,23 +476,41 @@ class Diagrams(Resource):
             if diagram_type:
                 query = query.filter(Diagram.diagram_type == diagram_type)
             
+            if cursor is not None:
+                # Keyset pagination: seek past the cursor on the primary key, no count or offset scan
+                try:
+                    cursor_id = int(cursor) if cursor else None
+                except ValueError:
+                    return INVALID_CURSOR_RESPONSE
+                # A page needs at least one row to carry the next cursor
+                limit = max(limit, 1)
+                if cursor_id is not None:
+                    query = query.filter(Diagram.id < cursor_id)
+                rows = query.order_by(Diagram.id.desc()).limit(limit + 1).all()
+                has_more = len(rows) > limit
+                diagrams_list = [Diagram.row_to_dict(row) for row in rows[:limit]]
+                
+                return json_response({
+                    'diagrams': diagrams_list,
+                    'limit': limit,
+                    'next_cursor': diagrams_list[-1]['id'] if has_more else None
+                })
+            
             # Get total count before pagination
             total = query.count()
             
             # Apply pagination and ordering
-            diagrams = query.order_by(Diagram.created_at.desc()).limit(limit).offset(offset).all()
+            diagrams = query.order_by(Diagram.created_at.desc(), Diagram.id.desc()).limit(limit).offset(offset).all()
             
             # Convert to dictionaries
-            diagrams_list = [diagram.to_dict() for diagram in diagrams]
+            diagrams_list = [Diagram.row_to_dict(row) for row in diagrams]
             
-            db.close()
-            
-            return {
+            return json_response({
                 'diagrams': diagrams_list,
                 'total': total,
                 'limit': limit,
                 'offset': offset
-            }, 200
+            })
             
         except Exception as e:
             return {'error': f'Internal server error: {str(e)}'}, 500
@@ -315,18 +524,16 @@ class DiagramDetail(Resource):
     @api.response(404, 'Not Found')
     def get(self, diagram_id):
         """Get a specific diagram by ID"""
+        db = SessionLocal()
         try:
-            db = next(get_db())
-            diagram = db.query(Diagram).filter(Diagram.id == diagram_id).first()
+            diagram = db.query(Diagram).options(raiseload('*')).filter(Diagram.id == diagram_id).first()
             
             if not diagram:
-                db.close()
                 return {'error': 'Diagram not found'}, 404
             
             diagram_dict = diagram.to_dict()
-            db.close()
             
-            return diagram_dict, 200
+            return json_response(diagram_dict)
             
         except Exception as e:
             return {'error': f'Internal server error: {str(e)}'}, 500
@@ -336,25 +543,47 @@ class DiagramDetail(Resource):
     @api.response(404, 'Not Found')
     def delete(self, diagram_id):
         """Delete a specific diagram by ID"""
+        db = SessionLocal()
         try:
-            db = next(get_db())
-            diagram = db.query(Diagram).filter(Diagram.id == diagram_id).first()
+            # Detach prompts generated from this diagram, as the ORM delete used to
+            db.query(GeneratedPrompt).filter(GeneratedPrompt.diagram_id == diagram_id).update(
+                {GeneratedPrompt.diagram_id: None}, synchronize_session=False
+            )
+            deleted = db.query(Diagram).filter(Diagram.id == diagram_id).delete(synchronize_session=False)
             
-            if not diagram:
-                db.close()
+            if not deleted:
+                db.rollback()
                 return {'error': 'Diagram not found'}, 404
             
-            db.delete(diagram)
             db.commit()
-            db.close()
             
-            return {'message': 'Diagram deleted successfully'}, 200
+            return json_response({'message': 'Diagram deleted successfully'})
             
         except Exception as e:
             db.rollback()
-            db.close()
             return {'error': f'Internal server error: {str(e)}'}, 500
 
+@lru_cache(maxsize=1)
+def models_response_body():
+    """Serialized /models payload; it only depends on configuration, so it is built once"""
+    if llm_client:
+        return orjson.dumps(llm_client.get_available_models())
+    
+    # When no API keys are configured, return all models as unavailable
+    # This allows the UI to show which models exist but warn the user
+    all_models = [
+        ModelInfo(name=model["name"], provider=model["provider"], available=False)
+        for model in Config.SUPPORTED_MODELS
+    ]
+    return orjson.dumps({
+        "models": all_models,
+        "warning": "No API keys configured. Please set at least one of: OPENAI_API_KEY, ANTHROPIC_API_KEY, or GEMINI_API_KEY"
+    })
+
+@lru_cache(maxsize=1)
+def models_response_etag():
+    return body_etag(models_response_body())
+
 @api.route('/models')
 class Models(Resource):
     """Get available AI models"""
@@ -364,19 +593,7 @@ class Models(Resource):
     def get(self):
         """Get list of available AI models"""
         try:
-            if llm_client:
-                models = llm_client.get_available_models()
-                return models, 200
-            
-            # When no API keys are configured, return all models as unavailable
-            # This allows the UI to show which models exist but warn the user
-            all_models = [
-                {**model, "available": False} for model in Config.SUPPORTED_MODELS
-            ]
-            return {
-                "models": all_models,
-                "warning": "No API keys configured. Please set at least one of: OPENAI_API_KEY, ANTHROPIC_API_KEY, or GEMINI_API_KEY"
-            }, 200
+            return conditional_json_response(models_response_body(), models_response_etag())
             
         except Exception as e:
             return {'error': f'Internal server error: {str(e)}'}, 500
@@ -391,12 +608,17 @@ class ValidateKey(Resource):
     def post(self):
         """Validate API key for a specific model"""
         try:
-            data = request.get_json()
-            if not data:
+            raw_data = request.get_data(cache=False)
+            if not raw_data:
                 return {'error': 'No JSON data provided'}, 400
             
-            model = data.get('model')
-            api_key = data.get('api_key')
+            try:
+                request_data = ValidateKeyRequest.model_validate_json(raw_data)
+            except Exception as e:
+                return {'error': f'Validation error: {str(e)}'}, 400
+            
+            model = request_data.model
+            api_key = request_data.api_key
             
             if not model or not api_key:
                 return {'error': 'Model and API key are required'}, 400
@@ -406,11 +628,26 @@ class ValidateKey(Resource):
             
             # Validate the key
             result = llm_client.validate_api_key(model, api_key)
-            return result, 200
+            return json_response(result)
             
         except Exception as e:
             return {'error': f'Internal server error: {str(e)}'}, 500
 
+# The system prompt list is static, so its JSON body is built once at import
+SYSTEM_PROMPTS_BODY = orjson.dumps({'available_prompts': [
+    SystemPromptInfo(
+        name='Mermaid Expert',
+        description='Expert system prompt analyzer and Mermaid diagram generator',
+        type='diagram_generation'
+    ),
+    SystemPromptInfo(
+        name='Prompt Generator',
+        description='Generate structured prompts from diagram representations',
+        type='prompt_generation'
+    )
+]})
+SYSTEM_PROMPTS_ETAG = body_etag(SYSTEM_PROMPTS_BODY)
+
 @api.route('/system-prompts')
 class SystemPrompts(Resource):
     """Get available system prompts"""
@@ -420,19 +657,7 @@ class SystemPrompts(Resource):
     def get(self):
         """Get list of available system prompts"""
         try:
-            prompts = [
-                {
-                    'name': 'Mermaid Expert',
-                    'description': 'Expert system prompt analyzer and Mermaid diagram generator',
-                    'type': 'diagram_generation'
-                },
-                {
-                    'name': 'Prompt Generator',
-                    'description': 'Generate structured prompts from diagram representations',
-                    'type': 'prompt_generation'
-                }
-            ]
-            return {'available_prompts': prompts}, 200
+            return conditional_json_response(SYSTEM_PROMPTS_BODY, SYSTEM_PROMPTS_ETAG)
             
         except Exception as e:
             return {'error': f'Internal server error: {str(e)}'}, 500
@@ -442,22 +667,20 @@ class SystemPrompts(Resource):
 class GeneratePrompt(Resource):
     """Generate a prompt from a diagram structure"""
     
-    @api.doc('generate_prompt')
-    @api.expect(generate_prompt_model)
+    @api.doc('generate_prompt', body=generate_prompt_model)
     @api.response(200, 'Success', generate_prompt_response)
     @api.response(400, 'Bad Request')
     @api.response(500, 'Internal Server Error')
     def post(self):
         """Generate a prompt from a diagram structure"""
         try:
-            # Parse request data
-            data = request.get_json()
-            if not data:
+            # Parse and validate the raw body in a single pass
+            raw_data = request.get_data(cache=False)
+            if not raw_data:
                 return {'error': 'No JSON data provided'}, 400
             
-            # Validate request
             try:
-                request_data = GeneratePromptRequest(**data)
+                request_data = GeneratePromptRequest.model_validate_json(raw_data)
             except Exception as e:
                 return {'error': f'Validation error: {str(e)}'}, 400
             
@@ -473,71 +696,60 @@ class GeneratePrompt(Resource):
             if not llm_client:
                 return {'error': 'LLM service not available'}, 500
             
-            # Convert diagram structure to dict for LLM
-            diagram_dict = {
-                'nodes': [
-                    {
-                        'id': node.id,
-                        'type': node.type,
-                        'label': node.label,
-                        'position': node.position
-                    }
-                    for node in request_data.diagram_structure.nodes
-                ],
-                'edges': [
-                    {
-                        'id': edge.id,
-                        'source': edge.source,
-                        'target': edge.target,
-                        'label': edge.label
-                    }
-                    for edge in request_data.diagram_structure.edges
-                ]
-            }
+            # Convert diagram structure to dict for LLM (single pass over the validated model)
+            diagram_dict = request_data.diagram_structure.model_dump()
+            
+            # Reuse a cached result for identical inputs
+            cache_key = None
+            if llm_cache:
+                cache_key = make_cache_key(
+                    'prompt',
+                    model=request_data.model or llm_client.default_model,
+                    format=request_data.prompt_format,
+                    diagram=diagram_dict,
+                    original_prompt=normalize_prompt(request_data.original_prompt),
+                    system_prompt=llm_client.prompt_generator_system_prompt_version
+                )
+                cached = llm_cache.get(cache_key)
+                if cached is not None:
+                    # The cached output is shared by identical inputs, but each request still
+                    # gets its own row (e.g. for its diagram_id)
+                    prompt_id = save_generated_prompt(
+                        request_data, diagram_dict, cached['generated_prompt'], cached['ai_model_used'], 0
+                    )
+                    return json_response({**cached, 'id': prompt_id, 'processing_time': 0, 'cached': True})
             
             # Generate prompt
-            result = llm_client.generate_prompt_from_diagram(
-                diagram_structure=diagram_dict,
-                original_prompt=request_data.original_prompt,
-                output_format=request_data.prompt_format,
-                model=request_data.model
-            )
+            try:
+                result = run_llm_call(llm_client.agenerate_prompt_from_diagram(
+                    diagram_structure=diagram_dict,
+                    original_prompt=request_data.original_prompt,
+                    output_format=request_data.prompt_format,
+                    model=request_data.model
+                ))
+            except ClientDisconnected:
+                return CLIENT_DISCONNECTED_RESPONSE
             
             if result['success']:
-                # Save generated prompt to database
-                prompt_id = None
-                try:
-                    db = next(get_db())
-                    generated_prompt = GeneratedPrompt(
-                        diagram_id=request_data.diagram_id,
-                        diagram_structure=json.dumps(diagram_dict),
-                        original_prompt=request_data.original_prompt,
-                        generated_prompt=result['generated_prompt'],
-                        prompt_format=request_data.prompt_format,
-                        model_used=result['model_used'],
-                        processing_time=result['processing_time'],
-                        success=True,
-                        error_message=None
-                    )
-                    db.add(generated_prompt)
-                    db.commit()
-                    prompt_id = generated_prompt.id
-                except Exception as db_error:
-                    print(f"Error saving generated prompt to database: {db_error}")
-                    db.rollback()
-                finally:
-                    db.close()
+                prompt_id = save_generated_prompt(
+                    request_data, diagram_dict, result['generated_prompt'],
+                    result['model_used'], result['processing_time']
+                )
                 
+                # Cached without the row id, which belongs to this request only
                 response_data = {
-                    'id': prompt_id,
                     'generated_prompt': result['generated_prompt'],
                     'prompt_format': request_data.prompt_format,
                     'success': True,
                     'ai_model_used': result['model_used'],
                     'processing_time': result['processing_time'],
-                    'error_message': None
+                    'error_message': None,
+                    'cached': False
                 }
-                return response_data, 200
+                # Only cache once the row is saved, so a failed save is retried by the next request
+                if cache_key and prompt_id is not None:
+                    llm_cache.set(cache_key, response_data)
+                return json_response({'id': prompt_id, **response_data})
             else:
                 return {'error': result['error_message']}, 500
                 
@@ -553,17 +765,17 @@ class GeneratedPrompts(Resource):
     @api.response(200, 'Success')
     def get(self):
         """Get list of generated prompts with optional filtering"""
+        db = SessionLocal()
         try:
-            db = next(get_db())
-            
             # Get query parameters
             diagram_id = request.args.get('diagram_id', type=int)
             prompt_format = request.args.get('format', '').strip()
             limit = int(request.args.get('limit', 50))
             offset = int(request.args.get('offset', 0))
+            cursor = request.args.get('cursor')  # '' for the first page, then the previous next_cursor
             
-            # Build query
-            query = db.query(GeneratedPrompt)
+            # Build query over plain column tuples; listings don't need ORM instances
+            query = db.query(*GeneratedPrompt.list_columns())
             
             # Apply filters
             if diagram_id:
@@ -572,23 +784,41 @@ class GeneratedPrompts(Resource):
             if prompt_format:
                 query = query.filter(GeneratedPrompt.prompt_format == prompt_format)
             
+            if cursor is not None:
+                # Keyset pagination: seek past the cursor on the primary key, no count or offset scan
+                try:
+                    cursor_id = int(cursor) if cursor else None
+                except ValueError:
+                    return INVALID_CURSOR_RESPONSE
+                # A page needs at least one row to carry the next cursor
+                limit = max(limit, 1)
+                if cursor_id is not None:
+                    query = query.filter(GeneratedPrompt.id < cursor_id)
+                rows = query.order_by(GeneratedPrompt.id.desc()).limit(limit + 1).all()
+                has_more = len(rows) > limit
+                prompts_list = [GeneratedPrompt.row_to_dict(row) for row in rows[:limit]]
+                
+                return json_response({
+                    'generated_prompts': prompts_list,
+                    'limit': limit,
+                    'next_cursor': prompts_list[-1]['id'] if has_more else None
+                })
+            
             # Get total count before pagination
             total = query.count()
             
             # Apply pagination and ordering
-            prompts = query.order_by(GeneratedPrompt.created_at.desc()).limit(limit).offset(offset).all()
+            prompts = query.order_by(GeneratedPrompt.created_at.desc(), GeneratedPrompt.id.desc()).limit(limit).offset(offset).all()
             
             # Convert to dictionaries
-            prompts_list = [prompt.to_dict() for prompt in prompts]
-            
-            db.close()
+            prompts_list = [GeneratedPrompt.row_to_dict(row) for row in prompts]
             
-            return {
+            return json_response({
                 'generated_prompts': prompts_list,
                 'total': total,
                 'limit': limit,
                 'offset': offset
-            }, 200
+            })
             
         except Exception as e:
             return {'error': f'Internal server error: {str(e)}'}, 500
@@ -603,18 +833,16 @@ class GeneratedPromptDetail(Resource):
     @api.response(404, 'Not Found')
     def get(self, prompt_id):
         """Get a specific generated prompt by ID"""
+        db = SessionLocal()
         try:
-            db = next(get_db())
-            prompt = db.query(GeneratedPrompt).filter(GeneratedPrompt.id == prompt_id).first()
+            prompt = db.query(GeneratedPrompt).options(raiseload('*')).filter(GeneratedPrompt.id == prompt_id).first()
             
             if not prompt:
-                db.close()
                 return {'error': 'Generated prompt not found'}, 404
             
             prompt_dict = prompt.to_dict()
-            db.close()
             
-            return prompt_dict, 200
+            return json_response(prompt_dict)
             
         except Exception as e:
             return {'error': f'Internal server error: {str(e)}'}, 500
@@ -624,21 +852,18 @@ class GeneratedPromptDetail(Resource):
     @api.response(404, 'Not Found')
     def delete(self, prompt_id):
         """Delete a specific generated prompt by ID"""
+        db = SessionLocal()
         try:
-            db = next(get_db())
-            prompt = db.query(GeneratedPrompt).filter(GeneratedPrompt.id == prompt_id).first()
+            deleted = db.query(GeneratedPrompt).filter(GeneratedPrompt.id == prompt_id).delete(synchronize_session=False)
             
-            if not prompt:
-                db.close()
+            if not deleted:
+                db.rollback()
                 return {'error': 'Generated prompt not found'}, 404
             
-            db.delete(prompt)
             db.commit()
-            db.close()
             
-            return {'message': 'Generated prompt deleted successfully'}, 200
+            return json_response({'message': 'Generated prompt deleted successfully'})
             
         except Exception as e:
             db.rollback()
-            db.close()
             return {'error': f'Internal server error: {str(e)}'}, 500 
\ No newline at end of file
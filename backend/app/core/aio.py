@@ -0,0 +1,95 @@
+import asyncio
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Any, AsyncIterator, Callable, Coroutine, Iterator, Optional
+
+# One event loop per process, run in a daemon thread, so sync request
+# handlers can hand coroutines (LLM calls) to a shared loop where they
+# interleave instead of each pinning its own blocking HTTP call
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    """Return the background event loop, starting it on first use"""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name='aio-loop', daemon=True).start()
+    return _loop
+
+
+def submit(coro: Coroutine) -> Future:
+    """Schedule a coroutine on the background loop and return its future"""
+    return asyncio.run_coroutine_threadsafe(coro, get_loop())
+
+
+def run_sync(coro: Coroutine, timeout: Optional[float] = None) -> Any:
+    """Run a coroutine on the background loop and block until it finishes"""
+    return submit(coro).result(timeout)
+
+
+_EXHAUSTED = object()
+
+
+async def _anext(iterator: AsyncIterator) -> Any:
+    try:
+        return await iterator.__anext__()
+    except StopAsyncIteration:
+        return _EXHAUSTED
+
+
+async def _aclose(iterator: AsyncIterator) -> None:
+    aclose = getattr(iterator, 'aclose', None)
+    if aclose is not None:
+        await aclose()
+
+
+def iterate_sync(iterator: AsyncIterator, timeout: Optional[float] = None) -> Iterator:
+    """
+    Consume an async iterator (e.g. a streamed LLM response) from sync code
+    
+    Each item is fetched on the background loop as the caller asks for it.
+    If the caller stops early, e.g. a streaming response whose client went
+    away, the async iterator is closed so the underlying request is aborted.
+    """
+    try:
+        while True:
+            item = run_sync(_anext(iterator), timeout)
+            if item is _EXHAUSTED:
+                return
+            yield item
+    finally:
+        run_sync(_aclose(iterator), timeout)
+
+
+class ClientDisconnected(Exception):
+    """Raised when a call is abandoned because the requesting client went away"""
+
+
+def run_until_disconnect(coro: Coroutine, is_disconnected: Callable[[], bool],
+                         poll_interval: float) -> Any:
+    """
+    Run a coroutine on the background loop, cancelling it if the client disconnects
+    
+    Args:
+        coro: Coroutine to run
+        is_disconnected: Called every poll_interval seconds while waiting
+        poll_interval: Seconds between disconnect checks
+        
+    Returns:
+        The coroutine's result
+        
+    Raises:
+        ClientDisconnected: If is_disconnected() returned True before completion
+    """
+    future = submit(coro)
+    while True:
+        try:
+            return future.result(poll_interval)
+        except FutureTimeoutError:  # Only an alias of the builtin TimeoutError from Python 3.11
+            if is_disconnected():
+                # Cancels the task on the loop, which aborts the in-flight HTTP request
+                future.cancel()
+                raise ClientDisconnected()
@@ -0,0 +1,79 @@
+import asyncio
+from typing import Any, Dict, Optional, Set
+from config import Config
+
+
+class DiagramBatcher:
+    """
+    Coalesces diagram generation requests that arrive within a short window
+    
+    Requests are queued on the background event loop; a single worker drains
+    up to max_size of them (waiting at most window seconds after the first)
+    and starts the batch's LLM calls together, each as its own task that
+    resolves its caller's future (and is cancelled if the caller gives up).
+    """
+    
+    def __init__(self, client, max_size: Optional[int] = None, window: Optional[float] = None):
+        self.client = client
+        self.max_size = max_size or Config.LLM_BATCH_MAX_SIZE
+        self.window = window if window is not None else Config.LLM_BATCH_WINDOW_MS / 1000
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        # In-flight request tasks; the loop only keeps weak references to tasks
+        self._dispatches: Set[asyncio.Task] = set()
+    
+    async def generate(self, user_prompt: str, model: Optional[str] = None,
+                       diagram_type: str = "flowchart") -> Dict[str, Any]:
+        """Queue one diagram request and wait for its result (same shape as agenerate_diagram)"""
+        # Runs on the event loop thread, so lazy start needs no lock
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+        
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put(((user_prompt, model, diagram_type), future))
+        return await future
+    
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.window
+            
+            # Collect more requests until the batch is full or the window closes
+            while len(batch) < self.max_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            
+            # Dispatch without blocking collection of the next batch
+            for request, future in batch:
+                self._dispatch(request, future)
+    
+    def _dispatch(self, request: tuple, future: asyncio.Future) -> None:
+        """Run one request as its own task, linked both ways to the caller's future"""
+        if future.done():
+            return
+        # Providers have no multi-conversation endpoint, so a batch is its requests
+        # started together; separate tasks let a caller that gives up (e.g. its
+        # client disconnected) cancel its own provider call without the others
+        task = asyncio.ensure_future(self.client.agenerate_diagram(*request))
+        self._dispatches.add(task)
+        task.add_done_callback(self._dispatches.discard)
+        task.add_done_callback(lambda done: self._resolve(future, done))
+        future.add_done_callback(lambda _: task.cancel() if future.cancelled() else None)
+    
+    @staticmethod
+    def _resolve(future: asyncio.Future, task: asyncio.Task) -> None:
+        if future.done():
+            return
+        if task.cancelled():
+            future.cancel()
+        elif task.exception() is not None:
+            future.set_exception(task.exception())
+        else:
+            future.set_result(task.result())
@@ -1,9 +1,14 @@
+import logging
 import os
-from sqlalchemy import create_engine
+import orjson
+from sqlalchemy import create_engine, event, inspect
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.orm import sessionmaker, scoped_session
 from sqlalchemy.ext.declarative import declarative_base
 from config import Config
 
+log = logging.getLogger(__name__)
+
 # Base class for declarative models
 Base = declarative_base()
 
@@ -17,26 +22,131 @@ os.makedirs(DB_DIR, exist_ok=True)
 # Create SQLite engine
 engine = create_engine(
     f'sqlite:///{DB_PATH}',
-    connect_args={'check_same_thread': False},  # Needed for SQLite
-    echo=False  # Set to True for SQL query logging
+    connect_args={'check_same_thread': False},  # Pooled connections are handed to different request threads
+    pool_size=Config.DB_POOL_SIZE,
+    max_overflow=Config.DB_MAX_OVERFLOW,
+    pool_pre_ping=True,
+    pool_recycle=Config.DB_POOL_RECYCLE,
+    echo=False,  # Set to True for SQL query logging
+    # Encode/decode JSON columns with orjson instead of the stdlib json module
+    json_serializer=lambda obj: orjson.dumps(obj).decode(),
+    json_deserializer=orjson.loads
+)
+
+# SQLite connection tuning: WAL lets readers proceed while a write is in progress,
+# and synchronous=NORMAL is durable in WAL mode while avoiding an fsync per commit
+SQLITE_PRAGMAS = (
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA temp_store=MEMORY',
+    f'PRAGMA mmap_size={Config.SQLITE_MMAP_SIZE}',
+    f'PRAGMA cache_size=-{Config.SQLITE_CACHE_SIZE_KB}',
+    f'PRAGMA busy_timeout={Config.SQLITE_BUSY_TIMEOUT_MS}',
 )
 
+@event.listens_for(engine, 'connect')
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Apply the SQLite pragmas to each new pooled connection"""
+    cursor = dbapi_connection.cursor()
+    for pragma in SQLITE_PRAGMAS:
+        cursor.execute(pragma)
+    cursor.close()
+
 # Create session factory
-SessionLocal = scoped_session(sessionmaker(autocommit=False, autoflush=False, bind=engine))
+# expire_on_commit=False: committed rows keep their INSERT ... RETURNING values, so
+# reading e.g. the new id after commit() does not trigger a refresh SELECT
+SessionLocal = scoped_session(sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine))
+
+# Full-text index over the searchable diagram columns, kept in sync by triggers.
+# The trigram tokenizer matches arbitrary substrings, like the LIKE '%term%'
+# search it backs, but from the index instead of a full table scan.
+DIAGRAMS_FTS_TABLE = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS diagrams_fts USING fts5("
+    "original_prompt, mermaid_code, content='diagrams', content_rowid='id', tokenize='trigram')"
+)
+DIAGRAMS_FTS_TRIGGERS = (
+    "CREATE TRIGGER IF NOT EXISTS diagrams_fts_insert AFTER INSERT ON diagrams BEGIN "
+    "INSERT INTO diagrams_fts(rowid, original_prompt, mermaid_code) "
+    "VALUES (new.id, new.original_prompt, new.mermaid_code); END",
+    "CREATE TRIGGER IF NOT EXISTS diagrams_fts_delete AFTER DELETE ON diagrams BEGIN "
+    "INSERT INTO diagrams_fts(diagrams_fts, rowid, original_prompt, mermaid_code) "
+    "VALUES ('delete', old.id, old.original_prompt, old.mermaid_code); END",
+    "CREATE TRIGGER IF NOT EXISTS diagrams_fts_update AFTER UPDATE ON diagrams BEGIN "
+    "INSERT INTO diagrams_fts(diagrams_fts, rowid, original_prompt, mermaid_code) "
+    "VALUES ('delete', old.id, old.original_prompt, old.mermaid_code); "
+    "INSERT INTO diagrams_fts(rowid, original_prompt, mermaid_code) "
+    "VALUES (new.id, new.original_prompt, new.mermaid_code); END",
+)
+
+# Set by init_db; False when this SQLite build lacks FTS5 (search falls back to LIKE)
+fts_available = False
+
+def init_search_index():
+    """Create the diagrams full-text index and its sync triggers if missing"""
+    global fts_available
+    try:
+        with engine.begin() as connection:
+            exists = connection.exec_driver_sql(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'diagrams_fts'"
+            ).first()
+            if not exists:
+                # IF NOT EXISTS: a concurrent worker may create it after the check;
+                # both then rebuild, which is idempotent
+                connection.exec_driver_sql(DIAGRAMS_FTS_TABLE)
+                # Index rows that were stored before the table existed
+                connection.exec_driver_sql("INSERT INTO diagrams_fts(diagrams_fts) VALUES ('rebuild')")
+            for trigger in DIAGRAMS_FTS_TRIGGERS:
+                connection.exec_driver_sql(trigger)
+        fts_available = True
+    except OperationalError as e:
+        log.warning("Full-text search index unavailable, using LIKE search: %s", e)
+        fts_available = False
+
+def created_concurrently(error: OperationalError) -> bool:
+    """Whether DDL failed only because another worker applied it first"""
+    # Gunicorn workers (preload_app = False) each run init_db at boot, so two
+    # can pass the same existence check before either one's DDL lands
+    message = str(error.orig)
+    return 'already exists' in message or 'duplicate column name' in message
 
-def get_db():
-    """Get database session"""
-    db = SessionLocal()
+def create_if_missing(element):
+    """Create a table or index unless it (or a concurrent worker's copy) exists"""
     try:
-        yield db
-    finally:
-        db.close()
+        element.create(bind=engine, checkfirst=True)
+    except OperationalError as e:
+        if not created_concurrently(e):
+            raise
+
+def add_missing_columns():
+    """Add nullable columns introduced after a table was first created (create_all skips them)"""
+    inspector = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing and column.nullable:
+                column_type = column.type.compile(dialect=engine.dialect)
+                try:
+                    with engine.begin() as connection:
+                        connection.exec_driver_sql(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}')
+                except OperationalError as e:
+                    if not created_concurrently(e):
+                        raise
 
 def init_db():
     """Initialize database - create all tables"""
     from app.api.models import Diagram, GeneratedPrompt  # Import here to avoid circular imports
-    Base.metadata.create_all(bind=engine)
+    for table in Base.metadata.sorted_tables:
+        create_if_missing(table)
+    add_missing_columns()
+    
+    # Creating a table skips it if it already exists, indexes included, so
+    # add any indexes introduced after the database was first created
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            create_if_missing(index)
+    
+    init_search_index()
 
 def close_db():
-    """Close database connections"""
+    """Release the current thread's session (called once per request on app context teardown)"""
     SessionLocal.remove()
@@ -0,0 +1,143 @@
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+import orjson
+from config import Config
+
+log = logging.getLogger(__name__)
+
+
+def make_cache_key(op: str, **fields: Any) -> str:
+    """
+    Build a content-addressed cache key for an LLM call
+
+    Args:
+        op: Operation name (e.g., 'diagram', 'prompt')
+        **fields: Inputs that determine the LLM output
+
+    Returns:
+        Hex sha256 of the canonical (key-sorted) JSON encoding of the inputs
+    """
+    payload = orjson.dumps({'op': op, **fields}, option=orjson.OPT_SORT_KEYS)
+    return hashlib.sha256(payload).hexdigest()
+
+
+def normalize_prompt(text: Optional[str]) -> Optional[str]:
+    """
+    Normalize prompt text for cache keys so near-duplicate inputs share an entry
+
+    Leading/trailing whitespace is dropped and internal runs of whitespace
+    (including blank lines and indentation) collapse to a single space; wording
+    and letter case are kept, since they can change the generated labels.
+    """
+    if text is None:
+        return None
+    return ' '.join(text.split())
+
+
+class MemoryBackend:
+    """In-process LRU cache backend with per-entry expiry"""
+
+    name = 'memory'
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            value, expires_at = entry
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: Optional[int]) -> None:
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def size(self) -> int:
+        return len(self._entries)
+
+
+class RedisBackend:
+    """Redis cache backend, shared across worker processes"""
+
+    name = 'redis'
+
+    def __init__(self, url: str, prefix: str = 'promptviz:llm:'):
+        # Optional dependency, only needed when LLM_CACHE_REDIS_URL is set
+        import redis
+        self._client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key: str) -> Optional[Any]:
+        raw = self._client.get(self.prefix + key)
+        return orjson.loads(raw) if raw is not None else None
+
+    def set(self, key: str, value: Any, ttl: Optional[int]) -> None:
+        self._client.set(self.prefix + key, orjson.dumps(value), ex=ttl or None)
+
+    def size(self) -> int:
+        return -1  # Not tracked for a shared store
+
+
+class LLMCache:
+    """Cache for LLM results keyed on the inputs that produced them"""
+
+    def __init__(self, backend, default_ttl: Optional[int] = None):
+        self.backend = backend
+        self.default_ttl = default_ttl
+        self.stats = {'hits': 0, 'misses': 0, 'errors': 0}
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the cached value for key, or None on a miss"""
+        try:
+            value = self.backend.get(key)
+        except Exception:
+            # A broken cache backend must never fail the request
+            log.exception("Error reading LLM cache")
+            self.stats['errors'] += 1
+            value = None
+
+        self.stats['hits' if value is not None else 'misses'] += 1
+        return value
+
+    def set(self, key: str, value: Dict[str, Any], ttl: Optional[int] = None) -> None:
+        """Store value under key, expiring after ttl seconds (default_ttl if not given)"""
+        try:
+            self.backend.set(key, value, self.default_ttl if ttl is None else ttl)
+        except Exception:
+            log.exception("Error writing LLM cache")
+            self.stats['errors'] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and backend information"""
+        return {**self.stats, 'backend': self.backend.name, 'size': self.backend.size()}
+
+
+def create_llm_cache() -> Optional[LLMCache]:
+    """Create the LLM cache from configuration, or None when caching is disabled"""
+    if not Config.LLM_CACHE_ENABLED:
+        return None
+
+    if Config.LLM_CACHE_REDIS_URL:
+        backend = RedisBackend(Config.LLM_CACHE_REDIS_URL)
+    else:
+        backend = MemoryBackend(Config.LLM_CACHE_MAX_SIZE)
+
+    return LLMCache(backend, Config.LLM_CACHE_TTL)
@@ -1,13 +1,160 @@
 import os
+import random
 import time
+import asyncio
+import hashlib
 import json
-from typing import Optional, Dict, Any, List
+import logging
+import re
+from collections import defaultdict
+from functools import lru_cache
+from typing import Optional, Dict, Any, List, Tuple, AsyncIterator
+import httpx
 import litellm
-from litellm import completion
+from litellm import completion, acompletion
 from config import Config
-from app.utils.helpers import extract_mermaid_code_from_response
+from app.core.aio import run_sync
+from app.core.llm_cache import MemoryBackend
+from app.utils.helpers import extract_mermaid_code_from_response, sanitize_mermaid_code
+from app.api.models import ModelInfo
 
-litellm._turn_on_debug() # 👈 this is the 1-line change you need to make
+# Verbose LiteLLM logging formats and writes dozens of records per call,
+# so it is opt-in for local debugging only
+if Config.DEBUG and Config.LITELLM_DEBUG:
+    litellm._turn_on_debug()
+else:
+    logging.getLogger('LiteLLM').setLevel(logging.WARNING)
+
+# Share pooled HTTP clients across LLM calls so keep-alive connections
+# are reused instead of paying a TCP+TLS handshake per request
+LLM_HTTP_LIMITS = httpx.Limits(
+    max_connections=Config.LLM_MAX_CONNECTIONS,
+    max_keepalive_connections=Config.LLM_MAX_KEEPALIVE_CONNECTIONS
+)
+litellm.client_session = httpx.Client(limits=LLM_HTTP_LIMITS, timeout=Config.LITELLM_TIMEOUT)
+# Used by acompletion; every async call runs on the one background loop (app.core.aio),
+# which is the loop this client's pool binds to
+litellm.aclient_session = httpx.AsyncClient(limits=LLM_HTTP_LIMITS, timeout=Config.LITELLM_TIMEOUT)
+
+@lru_cache(maxsize=8)
+def _load_system_prompt(filename: str) -> str:
+    """Load a system prompt from file (cached, the files don't change at runtime)"""
+    try:
+        prompt_path = os.path.join(
+            os.path.dirname(__file__), 
+            'system_prompts', 
+            filename
+        )
+        with open(prompt_path, 'r', encoding='utf-8') as file:
+            return file.read()
+    except Exception as e:
+        # Fallback to default system prompt if file loading fails
+        if filename == 'MermaidExpertSystemPrompt.md':
+            return """You are an expert system prompt analyzer and Mermaid diagram generator. Your task is to analyze system prompts and create clear, well-structured Mermaid diagrams that visualize the prompt's structure, components, and relationships.
+
+Return ONLY the Mermaid diagram code, no explanations or additional text. The diagram should be immediately renderable by Mermaid.js."""
+        else:
+            return """You are an expert AI prompt engineer. Generate well-structured prompts based on diagram representations."""
+
+
+# Model name prefix -> provider, checked in order for models outside SUPPORTED_MODELS
+MODEL_PREFIX_PROVIDERS = (
+    ('gpt-', 'openai'),
+    ('o1', 'openai'),
+    ('claude-', 'anthropic'),
+    ('gemini/', 'google'),
+    ('gemini-', 'google'),
+)
+
+
+@lru_cache(maxsize=64)
+def _provider_for_model_name(model: str) -> str:
+    """Determine the provider from a model name prefix (defaults to openai for unknown models)"""
+    model_lower = model.lower()
+    for prefix, provider in MODEL_PREFIX_PROVIDERS:
+        if model_lower.startswith(prefix):
+            return provider
+    return 'openai'
+
+
+# Transient provider errors worth retrying (429s, 5xx, dropped connections, timeouts);
+# looked up by name since the set of exception classes varies across litellm releases
+RETRYABLE_LLM_ERRORS = tuple(
+    getattr(litellm, name) for name in (
+        'RateLimitError', 'APIConnectionError', 'Timeout',
+        'ServiceUnavailableError', 'InternalServerError'
+    ) if hasattr(litellm, name)
+)
+
+
+async def acompletion_with_retry(**kwargs: Any) -> Any:
+    """
+    Call litellm.acompletion, retrying transient errors with exponential backoff and full jitter
+    
+    Retries stop after LLM_RETRY_ATTEMPTS attempts, or earlier when the next wait
+    would run past the call's timeout, so retries stay within the request budget.
+    """
+    attempts = max(1, Config.LLM_RETRY_ATTEMPTS)
+    deadline = time.monotonic() + kwargs.get('timeout', Config.LITELLM_TIMEOUT)
+    for attempt in range(attempts):
+        try:
+            return await acompletion(**kwargs)
+        except RETRYABLE_LLM_ERRORS:
+            delay = random.uniform(0, min(Config.LLM_RETRY_MAX_DELAY, Config.LLM_RETRY_INITIAL_DELAY * 2 ** attempt))
+            if attempt == attempts - 1 or time.monotonic() + delay >= deadline:
+                raise
+            await asyncio.sleep(delay)
+
+
+# Node type -> heading used when describing a diagram to the prompt generator
+NODE_TYPE_DESCRIPTIONS = {
+    'rectangle': 'Main Instructions/Actions',
+    'diamond': 'Decision Points',
+    'rounded': 'Context/Examples',
+    'hexagon': 'Output Formats',
+    'parallelogram': 'Input/Output Operations',
+    'cylinder': 'Data Storage',
+    'circle': 'Events/Connectors'
+}
+
+ORIGINAL_PROMPT_HEADER = "\n\n## Original Prompt (for reference):\n\n"
+ORIGINAL_PROMPT_NOTE = "\n\nUse the original prompt as context to understand the intent, but generate the new prompt based on the diagram structure."
+
+
+@lru_cache(maxsize=32)
+def _diagram_user_prefix(diagram_type: str) -> str:
+    """Opening of the diagram generation user message (few distinct diagram types)"""
+    return f"Please analyze the following prompt and generate a Mermaid {diagram_type} diagram:\n\n"
+
+
+@lru_cache(maxsize=8)
+def _prompt_format_instructions(output_format: str) -> Tuple[str, str]:
+    """Opening and closing lines of the prompt generation user message for an output format"""
+    fmt = output_format.upper()
+    return (
+        f"Please generate a prompt in **{fmt}** format based on the following diagram:\n",
+        f"\n\nGenerate the prompt in **{fmt}** format. Output ONLY the prompt, no explanations."
+    )
+
+
+def _fingerprint(text: str) -> str:
+    """Short content hash identifying a version of a system prompt"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]
+
+
+# Cheap authenticated endpoints (model listings) used to check API keys
+# without running inference: provider -> (url, request kwargs for a key)
+KEY_VALIDATION_ENDPOINTS = {
+    'openai': ('https://api.openai.com/v1/models',
+               lambda key: {'headers': {'Authorization': f'Bearer {key}'}}),
+    'anthropic': ('https://api.anthropic.com/v1/models',
+                  lambda key: {'headers': {'x-api-key': key, 'anthropic-version': '2023-06-01'}}),
+    'google': ('https://generativelanguage.googleapis.com/v1beta/models',
+               lambda key: {'headers': {'x-goog-api-key': key}}),
+}
+
+# One diagram block in a multi-prompt (marshalled) response
+MARSHALLED_DIAGRAM_RE = re.compile(r'### DIAGRAM (\d+)\s*```mermaid(.*?)```', re.S)
 
 class LiteLLMClient:
     """Client for interacting with LiteLLM for AI-powered diagram generation"""
@@ -27,15 +174,26 @@ class LiteLLMClient:
             'google': Config.GEMINI_API_KEY,
         }
         self.default_model = Config.LITELLM_MODEL
+        self._provider_for_model = {m['name']: m['provider'] for m in Config.SUPPORTED_MODELS}
         self.timeout = Config.LITELLM_TIMEOUT
         
+        # Hashes of recently validated API keys (the keys themselves aren't kept)
+        self._validated_keys = MemoryBackend(Config.API_KEY_VALIDATION_CACHE_SIZE)
+        
         # Load system prompts
-        self.system_prompt = self._load_system_prompt('MermaidExpertSystemPrompt.md')
-        self.prompt_generator_system_prompt = self._load_system_prompt('PromptGeneratorSystemPrompt.md')
+        self.system_prompt = _load_system_prompt('MermaidExpertSystemPrompt.md')
+        self.prompt_generator_system_prompt = _load_system_prompt('PromptGeneratorSystemPrompt.md')
+        
+        # Short fingerprints of the system prompts, so cached results from older prompt
+        # versions aren't served after the files change
+        self.system_prompt_version = _fingerprint(self.system_prompt)
+        self.prompt_generator_system_prompt_version = _fingerprint(self.prompt_generator_system_prompt)
         
         # Check if at least one API key is configured
         if not any(self.api_keys.values()):
             raise ValueError("No API keys configured. Please set at least one of: OPENAI_API_KEY, ANTHROPIC_API_KEY, or GEMINI_API_KEY")
+        
+        self._available_models = self._build_available_models()
     
     def _get_provider_for_model(self, model: str) -> str:
         """
@@ -47,17 +205,8 @@ class LiteLLMClient:
         Returns:
             Provider name: 'openai', 'anthropic', or 'google'
         """
-        model_lower = model.lower()
-        
-        if model_lower.startswith('gpt-') or model_lower.startswith('o1'):
-            return 'openai'
-        elif model_lower.startswith('claude-'):
-            return 'anthropic'
-        elif model_lower.startswith('gemini/') or model_lower.startswith('gemini-'):
-            return 'google'
-        else:
-            # Default to openai for unknown models
-            return 'openai'
+        # Supported models are a dict hit; anything else falls back to a cached prefix match
+        return self._provider_for_model.get(model) or _provider_for_model_name(model)
     
     def _get_api_key_for_model(self, model: str) -> Optional[str]:
         """
@@ -72,30 +221,47 @@ class LiteLLMClient:
         provider = self._get_provider_for_model(model)
         return self.api_keys.get(provider)
     
-    def _load_system_prompt(self, filename: str) -> str:
-        """Load a system prompt from file"""
-        try:
-            prompt_path = os.path.join(
-                os.path.dirname(__file__), 
-                'system_prompts', 
-                filename
-            )
-            with open(prompt_path, 'r', encoding='utf-8') as file:
-                return file.read()
-        except Exception as e:
-            # Fallback to default system prompt if file loading fails
-            if filename == 'MermaidExpertSystemPrompt.md':
-                return """You are an expert system prompt analyzer and Mermaid diagram generator. Your task is to analyze system prompts and create clear, well-structured Mermaid diagrams that visualize the prompt's structure, components, and relationships.
-
-Return ONLY the Mermaid diagram code, no explanations or additional text. The diagram should be immediately renderable by Mermaid.js."""
-            else:
-                return """You are an expert AI prompt engineer. Generate well-structured prompts based on diagram representations."""
+    def _require_api_key_for_model(self, model: str) -> str:
+        """Get the API key for the model's provider, raising if it isn't configured"""
+        api_key = self._get_api_key_for_model(model)
+        if not api_key:
+            provider = self._get_provider_for_model(model)
+            raise ValueError(f"No API key configured for {provider}. Please set {self.PROVIDER_KEY_MAP.get(provider, 'API_KEY')} environment variable.")
+        return api_key
+    
+    def _build_diagram_messages(self, user_prompt: str, diagram_type: str) -> List[Dict[str, str]]:
+        """Build the chat messages for a diagram generation call"""
+        return [
+            {"role": "system", "content": self.system_prompt},
+            {"role": "user", "content": _diagram_user_prefix(diagram_type) + user_prompt},
+            {"role": "assistant", "content": "```mermaid"}
+        ]
     
     def generate_diagram(self, user_prompt: str, model: Optional[str] = None, 
                         diagram_type: str = "flowchart") -> Dict[str, Any]:
         """
         Generate Mermaid diagram using AI model with system prompt integration
         
+        Blocking wrapper around agenerate_diagram for non-async callers; the
+        call runs on the shared background event loop.
+        
+        Args:
+            user_prompt: The user's prompt to visualize
+            model: AI model to use (defaults to configured model)
+            diagram_type: Type of diagram to generate
+            
+        Returns:
+            Dictionary containing the generated diagram and metadata
+        """
+        return run_sync(self.agenerate_diagram(user_prompt, model, diagram_type))
+    
+    async def agenerate_diagram(self, user_prompt: str, model: Optional[str] = None,
+                                diagram_type: str = "flowchart") -> Dict[str, Any]:
+        """
+        Generate Mermaid diagram using AI model with system prompt integration
+        
+        Awaits litellm.acompletion so many calls can be in flight on one event loop.
+        
         Args:
             user_prompt: The user's prompt to visualize
             model: AI model to use (defaults to configured model)
@@ -109,40 +275,27 @@ Return ONLY the Mermaid diagram code, no explanations or additional text. The di
         
         try:
             # Get the appropriate API key for this model
-            api_key = self._get_api_key_for_model(model_to_use)
-            if not api_key:
-                provider = self._get_provider_for_model(model_to_use)
-                raise ValueError(f"No API key configured for {provider}. Please set {self.PROVIDER_KEY_MAP.get(provider, 'API_KEY')} environment variable.")
+            api_key = self._require_api_key_for_model(model_to_use)
             
             # Make API call to LiteLLM
-            response = completion(
+            response = await acompletion_with_retry(
                 model=model_to_use,
-                messages=[
-                    {"role": "system", "content": self.system_prompt},
-                    {"role": "user", "content": f"Please analyze the following prompt and generate a Mermaid {diagram_type} diagram:\n\n{user_prompt}"},
-                    {"role": "assistant", "content": f"```mermaid"}
-                ],
+                messages=self._build_diagram_messages(user_prompt, diagram_type),
                 api_key=api_key,
                 timeout=self.timeout,
                 temperature=0.1,  # Low temperature for consistent output
                 max_tokens=100000
             )
             
-            
-            # Extract the generated content
-            ai_response = response.choices[0].message.content
-            # ai_response = """flowchart TD\n    A[Start: Receive System Prompt] --> B{Analyze System Prompt}\n    B --> C[Identify Key Components]\n    C --> D{Identify Relationships Between Components}\n    D --> E{Identify Flow and Logic Structure}\n    E --> F{Identify Conditional Statements and Decision Points}\n    F --> G{Identify Input/Output Specifications}\n    G --> H[Generate Mermaid Diagram]\n    H --> I{Use Flowchart TD Format}\n    I --> J[Create Clear Node Labels]\n    J --> K[Show Logical Flow and Relationships]\n    K --> L[Use Appropriate Mermaid Syntax and Styling]\n    L --> M[Ensure Diagram is Easy to Read and Understand]\n    M --> N[Coverage: Be Verbose and Cover All Details]\n    N --> O{Use Rectangles for Main Instructions}\n    O --> P{Use Diamonds for Decision Points}\n    P --> Q{Use Rounded Rectangles for Context/Examples}\n    Q --> R{Use Hexagons for Output Formats}\n    R --> S[Use Arrows to Show Flow Direction]\n    S --> T[Use Arrows to Show Conditional Paths]\n    T --> U[Use Arrows to Show Dependencies and Relationships]\n    U --> V[Apply Consistent Styling]\n    V --> W[Use Clear and Concise Labels]\n    W --> X[Group Related Components]\n    X --> Y[Maintain Logical Hierarchy]\n    Y --> Z{Check for Invalid Chars}\n    Z -->|Invalid Chars Found| AA[Correct the Mermaid Syntax]\n    Z -->|No Invalid Chars| BB[Output Only Mermaid Diagram Code]\n    AA --> BB\n    BB --> CC[End: Output Mermaid Diagram]\n"""
-            
             # Extract Mermaid code from the response
-            mermaid_code = extract_mermaid_code_from_response(ai_response)
-            
+            mermaid_code = extract_mermaid_code_from_response(response.choices[0].message.content)
             
             processing_time = time.time() - start_time
             
             return {
                 "mermaid_code": mermaid_code,
                 "success": True,
-                "model_used": model or self.default_model,
+                "model_used": model_to_use,
                 "processing_time": round(processing_time, 2),
                 "error_message": None
             }
@@ -153,68 +306,333 @@ Return ONLY the Mermaid diagram code, no explanations or additional text. The di
             return {
                 "mermaid_code": "",
                 "success": False,
-                "model_used": model or self.default_model,
+                "model_used": model_to_use,
                 "processing_time": round(processing_time, 2),
                 "error_message": str(e)
             }
     
-    def validate_api_key(self, model: str, api_key: str) -> Dict[str, Any]:
+    async def astream_diagram(self, user_prompt: str, model: Optional[str] = None,
+                              diagram_type: str = "flowchart") -> AsyncIterator[Dict[str, Any]]:
         """
-        Validate API key by making a test call
+        Generate Mermaid diagram with a streamed completion, yielding output as it arrives
         
         Args:
-            model: Model to test with
-            api_key: API key to validate
+            user_prompt: The user's prompt to visualize
+            model: AI model to use (defaults to configured model)
+            diagram_type: Type of diagram to generate
             
-        Returns:
-            Dictionary with validation result
+        Yields:
+            {"type": "chunk", "content": str} for each piece of raw model output, then
+            {"type": "result", "result": dict} with the same shape as agenerate_diagram returns
         """
+        start_time = time.time()
+        model_to_use = model or self.default_model
+        parts = []
+        
         try:
-            # Make a minimal test call
-            response = completion(
-                model=model,
-                messages=[{"role": "user", "content": "Hello"}],
+            # Get the appropriate API key for this model
+            api_key = self._require_api_key_for_model(model_to_use)
+            
+            # Make streaming API call to LiteLLM
+            response = await acompletion_with_retry(
+                model=model_to_use,
+                messages=self._build_diagram_messages(user_prompt, diagram_type),
                 api_key=api_key,
-                timeout=10,
-                max_tokens=10
+                timeout=self.timeout,
+                temperature=0.1,  # Low temperature for consistent output
+                max_tokens=100000,
+                stream=True
             )
             
-            return {
-                "valid": True,
-                "error": None
+            async for chunk in response:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    parts.append(delta)
+                    yield {"type": "chunk", "content": delta}
+            
+            # Sanitize once the full diagram has arrived
+            result = {
+                "mermaid_code": extract_mermaid_code_from_response(''.join(parts)),
+                "success": True,
+                "model_used": model_to_use,
+                "processing_time": round(time.time() - start_time, 2),
+                "error_message": None
             }
             
         except Exception as e:
-            return {
-                "valid": False,
-                "error": str(e)
+            result = {
+                "mermaid_code": "",
+                "success": False,
+                "model_used": model_to_use,
+                "processing_time": round(time.time() - start_time, 2),
+                "error_message": str(e)
             }
+        
+        yield {"type": "result", "result": result}
     
-    def get_available_models(self) -> Dict[str, Any]:
+    async def agenerate_diagrams_batch(
+        self,
+        requests: List[Tuple[str, Optional[str], str]]
+    ) -> List[Dict[str, Any]]:
         """
-        Get list of available models, filtered by configured API keys
+        Generate several diagrams concurrently
         
+        Args:
+            requests: List of (user_prompt, model, diagram_type) tuples
+            
         Returns:
-            Dictionary with available models (only those with configured API keys)
+            Result dictionaries (as from agenerate_diagram) in request order
+        """
+        # Providers have no multi-conversation completion endpoint, so the
+        # calls run concurrently over the shared connection pool instead
+        return await asyncio.gather(*(
+            self.agenerate_diagram(user_prompt, model, diagram_type)
+            for user_prompt, model, diagram_type in requests
+        ))
+    
+    async def batch_generate_diagrams(
+        self,
+        prompts: List[str],
+        model: Optional[str] = None,
+        diagram_type: str = "flowchart",
+        max_concurrency: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Generate a diagram for each prompt, running the calls concurrently
+        
+        Args:
+            prompts: User prompts to visualize
+            model: AI model to use for every prompt (defaults to configured model)
+            diagram_type: Type of diagram to generate
+            max_concurrency: Max calls in flight at once (defaults to LLM_MAX_CONCURRENCY),
+                to stay under provider rate limits
+            
+        Returns:
+            Result dictionaries (as from agenerate_diagram) in prompt order
+        """
+        semaphore = asyncio.Semaphore(max_concurrency or Config.LLM_MAX_CONCURRENCY)
+        
+        async def generate_one(user_prompt: str) -> Dict[str, Any]:
+            async with semaphore:
+                return await self.agenerate_diagram(user_prompt, model, diagram_type)
+        
+        # Create every task up front so they all wait on the semaphore together
+        results = await asyncio.gather(*(generate_one(p) for p in prompts), return_exceptions=True)
+        
+        model_to_use = model or self.default_model
+        return [
+            result if not isinstance(result, BaseException) else {
+                "mermaid_code": "",
+                "success": False,
+                "model_used": model_to_use,
+                "processing_time": 0,
+                "error_message": str(result)
+            }
+            for result in results
+        ]
+    
+    def _build_marshalled_diagram_messages(self, user_prompts: List[str], diagram_type: str) -> List[Dict[str, str]]:
+        """Build the chat messages for one call that generates a diagram per prompt"""
+        numbered = '\n\n'.join(f"### PROMPT {i}\n{prompt}" for i, prompt in enumerate(user_prompts, 1))
+        return [
+            {"role": "system", "content": self.system_prompt},
+            {"role": "user", "content": (
+                f"Please analyze each of the following {len(user_prompts)} prompts and generate a Mermaid {diagram_type} diagram for each one.\n\n"
+                f"For prompt i, output a line `### DIAGRAM i` followed by the diagram in a ```mermaid code block. "
+                f"Output nothing else.\n\n{numbered}"
+            )}
+        ]
+    
+    async def _agenerate_marshalled_group(self, user_prompts: List[str], model_to_use: str,
+                                          diagram_type: str) -> List[Optional[Dict[str, Any]]]:
+        """
+        Generate diagrams for a group of prompts with a single completion call
+        
+        Prompts whose block is missing or empty in the response (or all of
+        them, if the call failed) get None in place of a result.
+        """
+        start_time = time.time()
+        
+        try:
+            api_key = self._require_api_key_for_model(model_to_use)
+            response = await acompletion_with_retry(
+                model=model_to_use,
+                messages=self._build_marshalled_diagram_messages(user_prompts, diagram_type),
+                api_key=api_key,
+                timeout=self.timeout,
+                temperature=0.1,  # Low temperature for consistent output
+                max_tokens=100000
+            )
+            blocks = {
+                int(match.group(1)): match.group(2)
+                for match in MARSHALLED_DIAGRAM_RE.finditer(response.choices[0].message.content or '')
+            }
+        except Exception:
+            blocks = {}
+        
+        processing_time = round(time.time() - start_time, 2)
+        results = []
+        for i in range(1, len(user_prompts) + 1):
+            mermaid_code = sanitize_mermaid_code(blocks[i].strip()) if i in blocks else ''
+            if mermaid_code:
+                results.append({
+                    "mermaid_code": mermaid_code,
+                    "success": True,
+                    "model_used": model_to_use,
+                    "processing_time": processing_time,
+                    "error_message": None
+                })
+            else:
+                results.append(None)
+        return results
+    
+    async def agenerate_diagrams_marshalled(
+        self,
+        prompts: List[str],
+        model: Optional[str] = None,
+        diagram_type: str = "flowchart",
+        k: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Generate a diagram for each prompt, packing k prompts into each completion call
+        
+        The system prompt is sent once per group instead of once per prompt and
+        fewer requests count against provider RPM limits. Groups run concurrently
+        (bounded by LLM_MAX_CONCURRENCY); prompts whose diagram is missing from
+        a group response are retried on their own.
+        
+        Args:
+            prompts: User prompts to visualize
+            model: AI model to use for every prompt (defaults to configured model)
+            diagram_type: Type of diagram to generate
+            k: Prompts per call (defaults to LLM_MARSHAL_SIZE)
+            
+        Returns:
+            Result dictionaries (as from agenerate_diagram) in prompt order
         """
-        # Get supported models from central config
-        all_models = Config.SUPPORTED_MODELS
+        model_to_use = model or self.default_model
+        k = max(1, k or Config.LLM_MARSHAL_SIZE)
+        semaphore = asyncio.Semaphore(Config.LLM_MAX_CONCURRENCY)
+        
+        async def generate_one(prompt: str) -> Dict[str, Any]:
+            async with semaphore:
+                return await self.agenerate_diagram(prompt, model_to_use, diagram_type)
+        
+        async def generate_group(group: List[str]) -> List[Dict[str, Any]]:
+            if len(group) == 1:
+                return [await generate_one(group[0])]
+            async with semaphore:
+                results = await self._agenerate_marshalled_group(group, model_to_use, diagram_type)
+            
+            # Retry prompts missing from the group response on their own, concurrently,
+            # after the group call has given back its slot
+            missing = [i for i, result in enumerate(results) if result is None]
+            if missing:
+                retried = await asyncio.gather(*(generate_one(group[i]) for i in missing))
+                for i, result in zip(missing, retried):
+                    results[i] = result
+            return results
+        
+        groups = [prompts[i:i + k] for i in range(0, len(prompts), k)]
+        group_results = await asyncio.gather(*(generate_group(group) for group in groups))
+        return [result for results in group_results for result in results]
+    
+    def generate_diagrams_marshalled(self, prompts: List[str], model: Optional[str] = None,
+                                     diagram_type: str = "flowchart", k: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Blocking wrapper around agenerate_diagrams_marshalled for non-async callers"""
+        return run_sync(self.agenerate_diagrams_marshalled(prompts, model, diagram_type, k))
+    
+    def _check_key_with_models_endpoint(self, provider: str, api_key: str) -> Optional[Dict[str, Any]]:
+        """
+        Check an API key against the provider's model-listing endpoint
+        
+        Returns:
+            Validation result, or None when the answer is inconclusive (unknown
+            provider, network error, unexpected status) and a test call is needed
+        """
+        endpoint = KEY_VALIDATION_ENDPOINTS.get(provider)
+        if endpoint is None:
+            return None
+        
+        url, auth = endpoint
+        try:
+            response = litellm.client_session.get(url, timeout=5, **auth(api_key))
+        except httpx.HTTPError:
+            return None
         
+        if response.status_code == 200:
+            return {"valid": True, "error": None}
+        if response.status_code in (400, 401, 403):
+            return {"valid": False, "error": f"Invalid API key for {provider} (HTTP {response.status_code})"}
+        return None
+    
+    def validate_api_key(self, model: str, api_key: str) -> Dict[str, Any]:
+        """
+        Validate API key with the provider's models endpoint, falling back to a test call
+        
+        Successful validations are remembered for API_KEY_VALIDATION_TTL seconds
+        so repeated checks of the same key skip the network entirely.
+        
+        Args:
+            model: Model to test with
+            api_key: API key to validate
+            
+        Returns:
+            Dictionary with validation result
+        """
+        provider = self._get_provider_for_model(model)
+        cache_key = hashlib.sha256(f"{provider}:{api_key}".encode()).hexdigest()
+        if self._validated_keys.get(cache_key):
+            return {"valid": True, "error": None}
+        
+        result = self._check_key_with_models_endpoint(provider, api_key)
+        if result is None:
+            try:
+                # Make a minimal test call
+                completion(
+                    model=model,
+                    messages=[{"role": "user", "content": "Hello"}],
+                    api_key=api_key,
+                    timeout=10,
+                    max_tokens=1
+                )
+                result = {"valid": True, "error": None}
+                
+            except Exception as e:
+                result = {"valid": False, "error": str(e)}
+        
+        if result["valid"]:
+            self._validated_keys.set(cache_key, True, Config.API_KEY_VALIDATION_TTL)
+        return result
+    
+    def _build_available_models(self) -> Tuple[ModelInfo, ...]:
+        """Build the supported model list with availability from the configured API keys"""
         # Filter models based on configured API keys
-        models = []
-        for model in all_models:
-            provider = model["provider"]
-            has_key = bool(self.api_keys.get(provider))
-            models.append({
-                "name": model["name"],
-                "provider": provider,
-                "available": has_key
-            })
+        models = [
+            ModelInfo(
+                name=model["name"],
+                provider=model["provider"],
+                available=bool(self.api_keys.get(model["provider"]))
+            )
+            for model in Config.SUPPORTED_MODELS
+        ]
         
         # Sort: available models first, preserving the preferred order within each group
-        models.sort(key=lambda m: (not m["available"]))
+        models.sort(key=lambda m: not m.available)
         
-        return {"models": models}
+        return tuple(models)
+    
+    def get_available_models(self) -> Dict[str, Any]:
+        """
+        Get list of available models, filtered by configured API keys
+        
+        The list is built once in __init__; keys and supported models are fixed
+        for the life of the process.
+        
+        Returns:
+            Dictionary with available models (only those with configured API keys)
+        """
+        return {"models": self._available_models}
     
     def _format_diagram_for_prompt(self, diagram_structure: Dict[str, Any]) -> str:
         """
@@ -229,35 +647,22 @@ Return ONLY the Mermaid diagram code, no explanations or additional text. The di
         nodes = diagram_structure.get('nodes', [])
         edges = diagram_structure.get('edges', [])
         
-        # Create node lookup for labels
-        node_labels = {node['id']: node.get('label', node['id']) for node in nodes}
+        # Build the label lookup and group nodes by type in one pass
+        node_labels = {}
+        node_types = defaultdict(list)
+        for node in nodes:
+            node_labels[node['id']] = node.get('label', node['id'])
+            node_types[node.get('type', 'rectangle')].append(node)
         
         lines = ["## Diagram Structure\n"]
         
         # Format nodes by type
         lines.append("### Nodes:\n")
-        node_types = {}
-        for node in nodes:
-            node_type = node.get('type', 'rectangle')
-            if node_type not in node_types:
-                node_types[node_type] = []
-            node_types[node_type].append(node)
-        
-        type_descriptions = {
-            'rectangle': 'Main Instructions/Actions',
-            'diamond': 'Decision Points',
-            'rounded': 'Context/Examples',
-            'hexagon': 'Output Formats',
-            'parallelogram': 'Input/Output Operations',
-            'cylinder': 'Data Storage',
-            'circle': 'Events/Connectors'
-        }
         
         for node_type, type_nodes in node_types.items():
-            desc = type_descriptions.get(node_type, node_type.capitalize())
+            desc = NODE_TYPE_DESCRIPTIONS.get(node_type, node_type.capitalize())
             lines.append(f"\n**{desc}:**")
-            for node in type_nodes:
-                lines.append(f"- [{node['id']}] {node.get('label', 'No label')}")
+            lines.extend(f"- [{node['id']}] {node.get('label', 'No label')}" for node in type_nodes)
         
         # Format edges (flow)
         lines.append("\n### Flow/Connections:\n")
@@ -273,6 +678,49 @@ Return ONLY the Mermaid diagram code, no explanations or additional text. The di
         
         return '\n'.join(lines)
     
+    def _build_prompt_messages(
+        self,
+        diagram_structure: Dict[str, Any],
+        original_prompt: Optional[str],
+        output_format: str
+    ) -> List[Dict[str, str]]:
+        """Build the chat messages for a prompt generation call"""
+        # Format the diagram structure for the LLM
+        diagram_text = self._format_diagram_for_prompt(diagram_structure)
+        
+        # Build the user message
+        header, footer = _prompt_format_instructions(output_format)
+        user_message_parts = [header, diagram_text]
+        
+        if original_prompt:
+            user_message_parts.append(ORIGINAL_PROMPT_HEADER + original_prompt)
+            user_message_parts.append(ORIGINAL_PROMPT_NOTE)
+        
+        user_message_parts.append(footer)
+        
+        user_message = '\n'.join(user_message_parts)
+        
+        return [
+            {"role": "system", "content": self.prompt_generator_system_prompt},
+            {"role": "user", "content": user_message}
+        ]
+    
+    @staticmethod
+    def _strip_code_fences(generated_prompt: str) -> str:
+        """Remove a surrounding markdown code block from a generated prompt"""
+        if generated_prompt.startswith('```'):
+            # Drop the opening fence line (e.g. ```xml)
+            first_newline = generated_prompt.find('\n')
+            if first_newline == -1:
+                return ''
+            generated_prompt = generated_prompt[first_newline + 1:]
+            
+            # Drop the last line if it is a closing fence
+            last_newline = generated_prompt.rfind('\n')
+            if generated_prompt[last_newline + 1:].strip() == '```':
+                generated_prompt = generated_prompt[:last_newline] if last_newline != -1 else ''
+        return generated_prompt
+    
     def generate_prompt_from_diagram(
         self,
         diagram_structure: Dict[str, Any],
@@ -283,6 +731,30 @@ Return ONLY the Mermaid diagram code, no explanations or additional text. The di
         """
         Generate a prompt from a diagram structure
         
+        Blocking wrapper around agenerate_prompt_from_diagram for non-async
+        callers; the call runs on the shared background event loop.
+        
+        Args:
+            diagram_structure: Dictionary with 'nodes' and 'edges' lists
+            original_prompt: Optional original prompt that generated the diagram
+            output_format: 'xml' or 'markdown'
+            model: AI model to use (defaults to configured model)
+            
+        Returns:
+            Dictionary containing the generated prompt and metadata
+        """
+        return run_sync(self.agenerate_prompt_from_diagram(diagram_structure, original_prompt, output_format, model))
+    
+    async def agenerate_prompt_from_diagram(
+        self,
+        diagram_structure: Dict[str, Any],
+        original_prompt: Optional[str] = None,
+        output_format: str = "xml",
+        model: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Generate a prompt from a diagram structure, awaiting litellm.acompletion
+        
         Args:
             diagram_structure: Dictionary with 'nodes' and 'edges' lists
             original_prompt: Optional original prompt that generated the diagram
@@ -297,60 +769,27 @@ Return ONLY the Mermaid diagram code, no explanations or additional text. The di
         
         try:
             # Get the appropriate API key for this model
-            api_key = self._get_api_key_for_model(model_to_use)
-            if not api_key:
-                provider = self._get_provider_for_model(model_to_use)
-                raise ValueError(f"No API key configured for {provider}. Please set {self.PROVIDER_KEY_MAP.get(provider, 'API_KEY')} environment variable.")
-            
-            # Format the diagram structure for the LLM
-            diagram_text = self._format_diagram_for_prompt(diagram_structure)
-            
-            # Build the user message
-            user_message_parts = [
-                f"Please generate a prompt in **{output_format.upper()}** format based on the following diagram:\n",
-                diagram_text
-            ]
-            
-            if original_prompt:
-                user_message_parts.append(f"\n\n## Original Prompt (for reference):\n\n{original_prompt}")
-                user_message_parts.append("\n\nUse the original prompt as context to understand the intent, but generate the new prompt based on the diagram structure.")
-            
-            user_message_parts.append(f"\n\nGenerate the prompt in **{output_format.upper()}** format. Output ONLY the prompt, no explanations.")
-            
-            user_message = '\n'.join(user_message_parts)
+            api_key = self._require_api_key_for_model(model_to_use)
             
             # Make API call to LiteLLM
-            response = completion(
+            response = await acompletion_with_retry(
                 model=model_to_use,
-                messages=[
-                    {"role": "system", "content": self.prompt_generator_system_prompt},
-                    {"role": "user", "content": user_message}
-                ],
+                messages=self._build_prompt_messages(diagram_structure, original_prompt, output_format),
                 api_key=api_key,
                 timeout=self.timeout,
                 temperature=0.3,  # Slightly higher for more creative prompt generation
                 max_tokens=8000
             )
             
-            # Extract the generated content
-            generated_prompt = response.choices[0].message.content
-            
             # Clean up the response (remove any markdown code blocks if present)
-            if generated_prompt.startswith('```'):
-                lines = generated_prompt.split('\n')
-                # Remove first and last lines if they're code block markers
-                if lines[0].startswith('```'):
-                    lines = lines[1:]
-                if lines and lines[-1].strip() == '```':
-                    lines = lines[:-1]
-                generated_prompt = '\n'.join(lines)
+            generated_prompt = self._strip_code_fences(response.choices[0].message.content)
             
             processing_time = time.time() - start_time
             
             return {
                 "generated_prompt": generated_prompt.strip(),
                 "success": True,
-                "model_used": model or self.default_model,
+                "model_used": model_to_use,
                 "processing_time": round(processing_time, 2),
                 "error_message": None
             }
@@ -361,7 +800,7 @@ Return ONLY the Mermaid diagram code, no explanations or additional text. The di
             return {
                 "generated_prompt": "",
                 "success": False,
-                "model_used": model or self.default_model,
+                "model_used": model_to_use,
                 "processing_time": round(processing_time, 2),
                 "error_message": str(e)
-            } 
\ No newline at end of file
+            }
\ No newline at end of file
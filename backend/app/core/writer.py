@@ -0,0 +1,116 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, List, Optional, Tuple
+from app.core.database import SessionLocal
+from config import Config
+
+log = logging.getLogger(__name__)
+
+
+class BatchWriter:
+    """
+    Persists ORM objects from a background thread in batched commits
+
+    Handlers enqueue new rows instead of committing them inline; a single
+    daemon thread drains up to max_batch of them (waiting at most window
+    seconds after the first) and saves them with one commit, so the fsync
+    cost is shared by every row in the batch and kept off the request path.
+    """
+
+    def __init__(self, max_batch: Optional[int] = None, window: Optional[float] = None):
+        self.max_batch = max_batch or Config.DB_WRITE_BATCH_SIZE
+        self.window = window if window is not None else Config.DB_WRITE_BATCH_WINDOW_MS / 1000
+        self._queue: "queue.Queue[Optional[Tuple[Any, Future]]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self) -> None:
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+                    self._thread.start()
+                    # Flush pending rows on interpreter shutdown
+                    atexit.register(self.stop)
+
+    def enqueue(self, obj: Any) -> Future:
+        """Queue a new ORM object for saving; the returned future resolves to it once committed"""
+        self._ensure_started()
+        future = Future()
+        self._queue.put((obj, future))
+        return future
+
+    def enqueue_and_wait(self, obj: Any, timeout: Optional[float] = None) -> Any:
+        """Queue a new ORM object and block until its batch is committed (e.g. to read its id)"""
+        return self.enqueue(obj).result(timeout)
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Commit anything still queued and stop the writer thread"""
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout)
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+
+            batch = [item]
+            stopping = False
+            deadline = time.monotonic() + self.window
+
+            # Collect more rows until the batch is full or the window closes
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            try:
+                self._commit(batch)
+            except Exception as e:
+                # Fail this batch's callers rather than let the error kill the writer thread
+                log.exception("Error committing database write batch")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            if stopping:
+                return
+
+    def _commit(self, batch: List[Tuple[Any, Future]]) -> None:
+        # Session owned by the writer thread, separate from request sessions
+        session = SessionLocal()
+        try:
+            session.add_all([obj for obj, _ in batch])
+            session.commit()
+            # Detach so committed rows aren't held in the identity map
+            session.expunge_all()
+        except Exception as e:
+            session.rollback()
+            if len(batch) > 1:
+                # Retry one by one so a single bad row doesn't drop the rest
+                for item in batch:
+                    self._commit([item])
+                return
+            log.exception("Error saving %s to database", type(batch[0][0]).__name__)
+            batch[0][1].set_exception(e)
+            return
+
+        for obj, future in batch:
+            future.set_result(obj)
+
+
+# Shared writer used by the API handlers
+db_writer = BatchWriter()
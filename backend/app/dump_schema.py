@@ -0,0 +1,24 @@
+"""Dump the Swagger schema into the app static folder so it is served as a file
+
+Usage: python -m app.dump_schema
+"""
+import os
+import orjson
+from app import create_app, SCHEMA_FILENAME
+
+
+def main():
+    # Only the routes are needed, so don't create the database in the image
+    app = create_app('production', init_database=False)
+    with app.test_request_context():
+        schema = app.extensions['api'].__schema__
+    
+    os.makedirs(app.static_folder, exist_ok=True)
+    path = os.path.join(app.static_folder, SCHEMA_FILENAME)
+    with open(path, 'wb') as f:
+        f.write(orjson.dumps(schema, option=orjson.OPT_SORT_KEYS))
+    print(f"Wrote {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,99 @@
+import decimal
+import hashlib
+import logging
 import os
-from typing import Optional
+import re
+import socket
+from typing import Any, Dict, Optional
+import orjson
+from flask import Response, request
+from flask.json.provider import JSONProvider
 from werkzeug.utils import secure_filename
 from config import Config
 
+log = logging.getLogger(__name__)
+
+# Non-string keys appear in some Flask-RESTX structures (e.g. response codes in the schema)
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+def _orjson_default(obj: Any) -> Any:
+    """Fallback for types orjson doesn't encode natively, matching Flask's defaults"""
+    if isinstance(obj, decimal.Decimal):
+        return str(obj)
+    if hasattr(obj, '__html__'):
+        return str(obj.__html__())
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def dumps_json(payload: Any) -> bytes:
+    """Serialize payload to JSON bytes with orjson"""
+    return orjson.dumps(payload, default=_orjson_default, option=ORJSON_OPTIONS)
+
+class OrjsonProvider(JSONProvider):
+    """Flask JSON provider backed by orjson, used by jsonify and request.get_json"""
+    
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        return dumps_json(obj).decode('utf-8')
+    
+    def loads(self, s: Any, **kwargs: Any) -> Any:
+        return orjson.loads(s)
+    
+    def response(self, *args: Any, **kwargs: Any) -> Response:
+        return self._app.response_class(
+            dumps_json(self._prepare_response_obj(args, kwargs)),
+            mimetype='application/json'
+        )
+
+def orjson_representation(data: Any, code: int, headers: Optional[Dict[str, Any]] = None) -> Response:
+    """Flask-RESTX representation for application/json that serializes with orjson"""
+    response = Response(dumps_json(data), status=code, mimetype='application/json')
+    response.headers.extend(headers or {})
+    return response
+
+def json_response(payload: Any, status: int = 200) -> Response:
+    """Serialize payload with orjson and wrap it in a JSON response"""
+    return Response(dumps_json(payload), status=status, mimetype='application/json')
+
+def json_bytes_response(body: bytes, status: int = 200) -> Response:
+    """Wrap an already-serialized JSON body in a response"""
+    return Response(body, status=status, mimetype='application/json')
+
+def body_etag(body: bytes) -> str:
+    """Strong ETag for a serialized response body"""
+    return hashlib.sha1(body).hexdigest()
+
+def conditional_json_response(body: bytes, etag: str) -> Response:
+    """Serve a static JSON body with its ETag, answering 304 when the client already has it"""
+    response = json_bytes_response(body)
+    response.set_etag(etag)
+    return response.make_conditional(request)
+
+def client_disconnected(environ: Dict[str, Any]) -> bool:
+    """
+    Check whether the client socket behind a WSGI request has been closed
+    
+    Uses the raw socket exposed by the Werkzeug dev server or Gunicorn; servers
+    that don't expose one (e.g. behind the ASGI adapter) report connected.
+    """
+    sock = environ.get('werkzeug.socket') or environ.get('gunicorn.socket')
+    if sock is None:
+        return False
+    try:
+        # A readable socket with no data means the peer closed its end
+        return sock.recv(1, socket.MSG_PEEK | socket.MSG_DONTWAIT) == b''
+    except BlockingIOError:
+        return False
+    except OSError:
+        return True
+
+# Matches a filename ending in one of the allowed extensions, compiled once at import
+ALLOWED_FILE_RE = re.compile(
+    r'\.(?:' + '|'.join(re.escape(ext) for ext in sorted(Config.ALLOWED_EXTENSIONS)) + r')\Z',
+    re.IGNORECASE
+)
+
 def allowed_file(filename: str) -> bool:
     """Check if file extension is allowed"""
-    return '.' in filename and \
-           filename.rsplit('.', 1)[1].lower() in Config.ALLOWED_EXTENSIONS
+    return ALLOWED_FILE_RE.search(filename) is not None
 
 def get_file_extension(filename: str) -> Optional[str]:
     """Get file extension from filename"""
@@ -34,10 +121,24 @@ def validate_prompt_text(text: str) -> bool:
         return False
     return True
 
+# Patterns used by sanitize_mermaid_code, compiled once at import
+# Node label with a parenthesised part: [Label (text)]
+_PAREN_LABEL_RE = re.compile(r'\[([^\]]*)\(([^)]*)\)([^\]]*)\]')
+# Stray uppercase ID after a closing bracket, up to the line end
+_TRAILING_ID_RE = re.compile(r'\]\s+([A-Z]{2,})\s*(\n|$)')
+_TRAILING_ID_EOL_RE = re.compile(r'\]\s*([A-Z]{2,})\s*$', re.MULTILINE)
+# Stray uppercase ID after the target node of an arrow
+_ARROW_TRAILING_ID_RE = re.compile(r'(-->[^\[\n]*\[[^\]]+\])\s+([A-Z]{2,})\s*(\n|$)')
+_MULTISPACE_RE = re.compile(r'[ \t]{2,}')
+# Line containing something other than whitespace and punctuation that can't be Mermaid syntax
+_VALID_LINE_RE = re.compile(r'^.*[\w\[\]{}|<>-].*$', re.MULTILINE)
+
+# Code block in an LLM reply, up to its last closing fence (or the end if it was cut off)
+_MERMAID_FENCE_RE = re.compile(r'```mermaid\s*(.*?)(?:```(?!.*```)|\Z)', re.DOTALL)
+_BARE_FENCE_RE = re.compile(r'```\s*(flowchart.*?)(?:```(?!.*```)|\Z)', re.DOTALL)
+
 def sanitize_mermaid_code(code: str) -> str:
     """Sanitize Mermaid code to remove invalid characters and fix syntax issues"""
-    import re
-    
     if not code:
         return code
     
@@ -46,8 +147,10 @@ def sanitize_mermaid_code(code: str) -> str:
     # Remove parentheses from node labels - replace with dashes
     # Pattern: [Label (text)] -> [Label - text]
     # Handle multiple parentheses in the same label
-    while re.search(r'\[([^\]]*)\(([^)]*)\)([^\]]*)\]', sanitized):
-        sanitized = re.sub(r'\[([^\]]*)\(([^)]*)\)([^\]]*)\]', r'[\1\3 - \2]', sanitized)
+    # Each pass rewrites every matching label at once; repeat only while something changed
+    replaced = 1
+    while replaced:
+        sanitized, replaced = _PAREN_LABEL_RE.subn(r'[\1\3 - \2]', sanitized)
     
     # Remove triple backticks that might be in labels
     sanitized = sanitized.replace('```', '')
@@ -55,54 +158,37 @@ def sanitize_mermaid_code(code: str) -> str:
     # Fix common syntax issues: remove extra text/IDs after closing brackets on same line
     # Pattern: ...]        TEXT or ...]        ID -> ...]
     # This handles cases like: A[Label]        MCC -> A[Label]
-    sanitized = re.sub(r'\]\s+([A-Z]{2,})\s*(\n|$)', r']\2', sanitized)
+    sanitized = _TRAILING_ID_RE.sub(r']\2', sanitized)
     
     # Remove any standalone text/IDs that appear after node definitions on the same line
     # Pattern: A[Label]ID -> A[Label]
-    sanitized = re.sub(r'\]\s*([A-Z]{2,})\s*$', r']', sanitized, flags=re.MULTILINE)
+    sanitized = _TRAILING_ID_EOL_RE.sub(r']', sanitized)
     
     # Fix lines that have node definitions followed by invalid text
     # Pattern: A[Label] --> B[Label]        TEXT -> A[Label] --> B[Label]
-    sanitized = re.sub(r'(-->[^\[\n]*\[[^\]]+\])\s+([A-Z]{2,})\s*(\n|$)', r'\1\3', sanitized)
+    sanitized = _ARROW_TRAILING_ID_RE.sub(r'\1\3', sanitized)
     
     # Clean up multiple spaces (but preserve single spaces)
-    sanitized = re.sub(r'[ \t]{2,}', ' ', sanitized)
-    
-    # Remove any lines that are just whitespace or invalid characters
-    lines = sanitized.split('\n')
-    cleaned_lines = []
-    for line in lines:
-        stripped = line.strip()
-        # Keep lines that have valid Mermaid syntax (nodes, arrows, etc.)
-        if stripped and (
-            '[' in stripped or 
-            ']' in stripped or 
-            '-->' in stripped or 
-            'flowchart' in stripped.lower() or
-            'graph' in stripped.lower() or
-            re.match(r'^\s*[A-Z]+\s*[\[{]', stripped)  # Node definitions
-        ):
-            cleaned_lines.append(line)
-        elif stripped and not re.match(r'^[^\w\[\]{}|-><]+$', stripped):
-            # Keep other potentially valid lines
-            cleaned_lines.append(line)
+    sanitized = _MULTISPACE_RE.sub(' ', sanitized)
     
-    return '\n'.join(cleaned_lines).strip()
+    # Keep only lines with at least one character that can be Mermaid syntax; blank lines
+    # and lines made only of other punctuation are dropped in the same pass
+    return '\n'.join(_VALID_LINE_RE.findall(sanitized)).strip()
 
 
 def extract_mermaid_code_from_response(response: str) -> str:
     """Extract Mermaid code from AI model response and sanitize it"""
     try:
-        # Remove first occurrence of ```mermaid
-        if "```mermaid" in response:
-            response = response.replace("```mermaid", "", 1)
-        # Remove last occurrence of ```
-        last_triple_tick = response.rfind("```")
-        if last_triple_tick != -1:
-            response = response[:last_triple_tick]
+        match = _MERMAID_FENCE_RE.search(response) or _BARE_FENCE_RE.search(response)
+        if match:
+            extracted = match.group(1)
+        else:
+            # Reply continues the prefilled ```mermaid, so only the closing fence is present
+            last_triple_tick = response.rfind("```")
+            extracted = response[:last_triple_tick] if last_triple_tick != -1 else response
         
-        # Extract and sanitize the code
-        extracted = response.strip()
+        # Sanitize the extracted code
+        extracted = extracted.strip()
         sanitized = sanitize_mermaid_code(extracted)
         return sanitized
         # # Look for Mermaid code blocks
@@ -127,8 +213,8 @@ def extract_mermaid_code_from_response(response: str) -> str:
         
         # # If no clear markers, return the entire response
         # return response.strip()
-    except Exception as e:
+    except Exception:
         # Ensure we don't return partial/broken strings
         # This will help prevent JSON serialization issues
-        print(f"Error extracting Mermaid code: {str(e)}")
+        log.exception("Error extracting Mermaid code")
         return str(response).strip() 
\ No newline at end of file
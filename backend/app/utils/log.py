@@ -0,0 +1,42 @@
+import atexit
+import logging
+import queue
+import sys
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+from config import Config
+
+LOG_FORMAT = '%(asctime)s %(levelname)s [%(name)s] %(message)s'
+
+_listener: Optional[QueueListener] = None
+
+# LiteLLM attaches its own stderr handler to these loggers on import
+LITELLM_LOGGERS = ('LiteLLM', 'LiteLLM Router', 'LiteLLM Proxy')
+
+def configure_logging(level: Optional[str] = None) -> None:
+    """
+    Route log records through a queue so request threads never block on log I/O
+
+    Records are handed to a QueueHandler on the root logger; a QueueListener
+    thread formats them and writes to stderr. Safe to call more than once.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    log_queue = queue.SimpleQueue()
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    root = logging.getLogger()
+    root.addHandler(QueueHandler(log_queue))
+    root.setLevel(level or Config.LOG_LEVEL)
+    # Keep LiteLLM records on its own handler only, or each one prints twice;
+    # set here because LiteLLM is imported after this runs
+    for name in LITELLM_LOGGERS:
+        logging.getLogger(name).propagate = False
+
+    _listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    # Flush queued records on interpreter shutdown
+    atexit.register(_listener.stop)
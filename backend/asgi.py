@@ -0,0 +1,8 @@
+import os
+from asgiref.wsgi import WsgiToAsgi
+from app import create_app
+
+# Create Flask application and expose it as an ASGI application
+# Run with: uvicorn asgi:asgi_app --workers N --loop uvloop --http httptools
+app = create_app(os.environ.get('FLASK_ENV', 'development'))
+asgi_app = WsgiToAsgi(app)
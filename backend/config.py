@@ -7,6 +7,7 @@ class Config:
     """Base configuration class"""
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-secret-key-change-in-production'
     DEBUG = os.environ.get('FLASK_DEBUG', 'False').lower() == 'true'
+    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
     
     # API Keys by Provider
     OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY')
@@ -16,15 +17,50 @@ class Config:
     # LiteLLM Configuration
     LITELLM_MODEL = os.environ.get('LITELLM_MODEL', 'gemini/gemini-2.5-flash-lite')
     LITELLM_TIMEOUT = int(os.environ.get('LITELLM_TIMEOUT', '60'))
+    LITELLM_DEBUG = os.environ.get('LITELLM_DEBUG') == '1'  # Verbose LiteLLM logging, honoured only with FLASK_DEBUG
+    LLM_MAX_CONNECTIONS = int(os.environ.get('LLM_MAX_CONNECTIONS', '100'))
+    LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.environ.get('LLM_MAX_KEEPALIVE_CONNECTIONS', '50'))
+    LLM_MAX_CONCURRENCY = int(os.environ.get('LLM_MAX_CONCURRENCY', '8'))  # Concurrent calls per batch_generate_diagrams
+    LLM_MARSHAL_SIZE = int(os.environ.get('LLM_MARSHAL_SIZE', '4'))  # Prompts packed into one call by generate_diagrams_marshalled
+    API_KEY_VALIDATION_TTL = int(os.environ.get('API_KEY_VALIDATION_TTL', '300'))  # Seconds a successful key check is reused
+    API_KEY_VALIDATION_CACHE_SIZE = int(os.environ.get('API_KEY_VALIDATION_CACHE_SIZE', '256'))
+    LLM_RETRY_ATTEMPTS = int(os.environ.get('LLM_RETRY_ATTEMPTS', '4'))  # Tries per LLM call on rate limits/transient errors
+    LLM_RETRY_INITIAL_DELAY = float(os.environ.get('LLM_RETRY_INITIAL_DELAY', '0.5'))  # Seconds, doubled per retry (with jitter)
+    LLM_RETRY_MAX_DELAY = float(os.environ.get('LLM_RETRY_MAX_DELAY', '8'))
+    LLM_DISCONNECT_POLL_INTERVAL = float(os.environ.get('LLM_DISCONNECT_POLL_INTERVAL', '0.5'))  # Seconds between client disconnect checks during LLM calls
+    
+    # LLM Response Cache Configuration
+    LLM_CACHE_ENABLED = os.environ.get('LLM_CACHE_ENABLED', 'True').lower() == 'true'
+    LLM_CACHE_TTL = int(os.environ.get('LLM_CACHE_TTL', '3600'))  # Seconds, 0 = no expiry
+    LLM_CACHE_MAX_SIZE = int(os.environ.get('LLM_CACHE_MAX_SIZE', '1024'))  # Entries (in-memory backend)
+    LLM_CACHE_REDIS_URL = os.environ.get('LLM_CACHE_REDIS_URL')  # Use Redis instead of in-memory when set
+    
+    # LLM Request Batching Configuration
+    LLM_BATCH_ENABLED = os.environ.get('LLM_BATCH_ENABLED', 'False').lower() == 'true'
+    LLM_BATCH_MAX_SIZE = int(os.environ.get('LLM_BATCH_MAX_SIZE', '16'))  # Requests per batch
+    LLM_BATCH_WINDOW_MS = int(os.environ.get('LLM_BATCH_WINDOW_MS', '20'))  # Max wait after the first request
+    
+    # Database Connection Pool Configuration
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '20'))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', '20'))
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', '1800'))
+    SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))  # Bytes
+    SQLITE_CACHE_SIZE_KB = int(os.environ.get('SQLITE_CACHE_SIZE_KB', '64000'))  # Page cache per connection
+    SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', '5000'))  # Wait for locks instead of failing
+    DB_WRITE_BATCH_SIZE = int(os.environ.get('DB_WRITE_BATCH_SIZE', '64'))  # Rows per background commit
+    DB_WRITE_BATCH_WINDOW_MS = int(os.environ.get('DB_WRITE_BATCH_WINDOW_MS', '50'))  # Max wait after the first queued row
+    DB_WRITE_WAIT_TIMEOUT = float(os.environ.get('DB_WRITE_WAIT_TIMEOUT', '5'))  # Seconds a request waits for its row to be committed
     
     # File Upload Configuration
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
+    MAX_UPLOAD_BYTES = int(os.environ.get('MAX_UPLOAD_BYTES', str(MAX_CONTENT_LENGTH)))  # Max bytes read from an uploaded prompt file
     ALLOWED_EXTENSIONS = {'txt', 'md', 'markdown'}
     
     # API Configuration
     API_TITLE = 'PromptViz API'
     API_VERSION = 'v1'
     API_DESCRIPTION = 'AI-powered system prompt visualization API'
+    API_DOCS_ENABLED = os.environ.get('API_DOCS_ENABLED', 'True').lower() == 'true'  # Serve Swagger UI at /
     
     # Supported AI Models (ordered by preference within each provider)
     SUPPORTED_MODELS = [
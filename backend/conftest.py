@@ -0,0 +1,27 @@
+"""
+Pytest fixtures for test_api.py
+
+The tests run against a live backend (python run.py) and are skipped when
+it isn't reachable.
+"""
+
+import pytest
+
+from test_backend import BASE_URL, backend_listening, make_session
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "slow: calls an LLM through the backend")
+
+@pytest.fixture(scope="session")
+def session():
+    """One pooled session shared by every test"""
+    session = make_session()
+    yield session
+    session.close()
+
+@pytest.fixture(scope="session")
+def base_url():
+    """Backend base URL, skipping the tests when the backend is down"""
+    if not backend_listening():
+        pytest.skip(f"Backend not listening at {BASE_URL}")
+    return BASE_URL
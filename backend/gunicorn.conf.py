@@ -0,0 +1,24 @@
+import multiprocessing
+import os
+
+# Gunicorn settings for production (gunicorn -c gunicorn.conf.py run:app)
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5001')}"
+
+# Threaded workers: LLM calls run on each worker's background event loop, so a
+# request thread mostly waits on a future and many of them fit in one process
+worker_class = 'gthread'
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', '32'))
+
+# Leave room for a full LLM call (including retries) before the worker is killed
+timeout = int(os.environ.get('LITELLM_TIMEOUT', '60')) + 30
+graceful_timeout = 30
+keepalive = 5
+
+# The app starts background threads (event loop, DB writer, log listener), which
+# don't survive a fork, so each worker imports the app itself
+preload_app = False
+
+accesslog = '-'
+errorlog = '-'
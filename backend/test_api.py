@@ -0,0 +1,43 @@
+"""
+Pytest versions of the test_backend.py checks, run against a live backend
+
+Fixtures live in conftest.py; the tests are skipped when the backend isn't
+running. Use -m "not slow" to skip the LLM call.
+"""
+
+import io
+import pytest
+
+from test_backend import (
+    FAST_TIMEOUT, GENERATE_DIAGRAM_BODY, GET_CHECKS, TEST_PROMPT,
+    check_get, diagram_model_available, json_loads, post_diagram
+)
+
+@pytest.mark.parametrize("name,path,count_key,noun", GET_CHECKS, ids=[check[1] for check in GET_CHECKS])
+def test_get(session, base_url, name, path, count_key, noun):
+    """GET endpoints respond with 200 and, where they list items, a list"""
+    out = io.StringIO()
+    assert check_get(name, path, count_key, noun, out, session), out.getvalue()
+
+@pytest.mark.parametrize("path", ["/api/models", "/api/system-prompts"])
+def test_conditional_get(session, base_url, path):
+    """Static endpoints answer a matching If-None-Match with an empty 304"""
+    response = session.get(base_url + path, timeout=FAST_TIMEOUT)
+    etag = response.headers.get("ETag")
+    assert etag
+    cached = session.get(base_url + path, headers={"If-None-Match": etag}, timeout=FAST_TIMEOUT)
+    assert cached.status_code == 304
+    assert not cached.content
+
+@pytest.mark.slow
+def test_diagram_generation(session, base_url):
+    """Diagram generation returns Mermaid code, or is skipped without an LLM"""
+    if not diagram_model_available(session):
+        pytest.skip(f"No API key configured for {TEST_PROMPT['model']}")
+    response = post_diagram(GENERATE_DIAGRAM_BODY, session)
+    data = json_loads(response.content)
+    if response.status_code == 500 and "LLM service not available" in data.get('error', ''):
+        pytest.skip("LLM service not available (API key not set)")
+    assert response.status_code == 200
+    assert data.get('success'), data.get('error_message')
+    assert data.get('mermaid_code')
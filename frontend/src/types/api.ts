@@ -11,6 +11,7 @@ export interface GenerateDiagramResponse {
   ai_model_used: string;
   processing_time?: number;
   error_message?: string;
+  cached?: boolean;
 }
 
 export interface ModelInfo {
@@ -108,12 +109,13 @@ export interface GeneratePromptResponse {
   ai_model_used: string;
   processing_time?: number;
   error_message?: string;
+  cached?: boolean;
 }
 
 export interface GeneratedPrompt {
   id: number;
   diagram_id?: number;
-  diagram_structure: string;
+  diagram_structure: DiagramStructure;
   original_prompt?: string;
   generated_prompt: string;
   prompt_format: string;